@@ -0,0 +1,51 @@
+"""initial schema (tables produced by new_script.ipynb)
+
+Revision ID: 0001
+Revises:
+Create Date: 2023-09-04 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _create_if_missing(name, *columns):
+    if not sa.inspect(op.get_bind()).has_table(name):
+        op.create_table(name, sa.Column("id", sa.Integer, primary_key=True), *columns)
+
+
+def upgrade():
+    # Les bases du notebook existent déjà: seules les tables absentes sont créées
+    _create_if_missing(
+        "dataset_as_mapping",
+        *(sa.Column(name, sa.String, nullable=True) for name in (
+            "asn", "status", "reference_orgs", "sibling_asns", "name", "descr", "website",
+            "comparison_with_ca2O", "comparison_with_pdb", "pdb_org_id", "pdb_org",
+        )),
+    )
+    _create_if_missing(
+        "delegated_stats",
+        *(sa.Column(name, sa.String, nullable=True) for name in (
+            "registry", "cc", "type", "start", "value", "date", "status", "opaque_id", "extensions",
+        )),
+    )
+    _create_if_missing(
+        "categorized_asn",
+        *(sa.Column(name, sa.String, nullable=True) for name in ("asn", "category_1", "category_2")),
+    )
+    _create_if_missing(
+        "relationship_asn",
+        *(sa.Column(name, sa.String, nullable=True) for name in ("asn", "customers", "providers")),
+    )
+
+
+def downgrade():
+    for name in ("relationship_asn", "categorized_asn", "delegated_stats", "dataset_as_mapping"):
+        op.drop_table(name)
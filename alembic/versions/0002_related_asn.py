@@ -0,0 +1,54 @@
+"""related_asn edge table, migrated from the str(list) columns
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2023-09-18 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import ast
+
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def _edges(bind):
+    for asn, sibling_asns in bind.execute(sa.text("SELECT asn, sibling_asns FROM dataset_as_mapping")):
+        for sibling in ast.literal_eval(sibling_asns) if sibling_asns else []:
+            yield asn, "sibling", str(sibling)
+    # La colonne customers du notebook contient en réalité les pairs: seuls les providers sont fiables
+    for asn, providers in bind.execute(sa.text("SELECT asn, providers FROM relationship_asn")):
+        for provider in ast.literal_eval(providers) if providers else []:
+            yield asn, "provider", str(provider)
+            yield str(provider), "customer", asn
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table("related_asn"):
+        op.create_table(
+            "related_asn",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("asn", sa.String, nullable=False),
+            sa.Column("kind", sa.String, nullable=False),
+            sa.Column("related_asn", sa.String, nullable=False),
+        )
+    op.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_related_asn_forward ON related_asn (asn, kind, related_asn)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_related_asn_reverse ON related_asn (related_asn, kind, asn)")
+
+    if bind.execute(sa.text("SELECT 1 FROM related_asn LIMIT 1")).first() is not None:
+        return
+    edges = list(_edges(bind))
+    if edges:
+        bind.exec_driver_sql(
+            "INSERT OR IGNORE INTO related_asn (asn, kind, related_asn) VALUES (?, ?, ?)", edges
+        )
+
+
+def downgrade():
+    op.drop_table("related_asn")
@@ -0,0 +1,38 @@
+"""indexes for every lookup issued by the API and the ingest upserts
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2023-10-02 10:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# (nom, table, colonnes, unique) -- mêmes noms que dans backend/api/database.py
+INDEXES = [
+    ("ix_dataset_as_mapping_asn", "dataset_as_mapping", "asn", True),
+    ("ix_delegated_stats_resource", "delegated_stats", "registry, type, start", True),
+    ("ix_delegated_stats_asn_lookup", "delegated_stats", "type, start, cc", False),
+    ("ix_delegated_stats_country", "delegated_stats", "cc, type, start, value", False),
+    ("ix_categorized_asn_asn", "categorized_asn", "asn", True),
+    ("ix_categorized_asn_categories", "categorized_asn", "category_1, category_2, asn", False),
+    ("ix_categorized_asn_category_2", "categorized_asn", "category_2, asn", False),
+    ("ix_relationship_asn_asn", "relationship_asn", "asn", True),
+]
+
+
+def upgrade():
+    for name, table, columns, unique in INDEXES:
+        op.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+    op.execute("ANALYZE")
+
+
+def downgrade():
+    for name, _, _, _ in INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
@@ -0,0 +1,30 @@
+"""dataset_snapshot: one row per committed ingest, used to version caches
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2023-10-09 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not sa.inspect(op.get_bind()).has_table("dataset_snapshot"):
+        op.create_table(
+            "dataset_snapshot",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("source", sa.String, nullable=True),
+            sa.Column("created_at", sa.String, nullable=True),
+        )
+
+
+def downgrade():
+    op.drop_table("dataset_snapshot")
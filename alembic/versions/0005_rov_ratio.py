@@ -0,0 +1,32 @@
+"""rov_ratio: RoVista ROV ratio time series per ASN
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2023-10-16 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not sa.inspect(op.get_bind()).has_table("rov_ratio"):
+        op.create_table(
+            "rov_ratio",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("asn", sa.String, nullable=False),
+            sa.Column("date", sa.String, nullable=False),
+            sa.Column("ratio", sa.Float, nullable=True),
+        )
+    op.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_rov_ratio_asn_date ON rov_ratio (asn, date)")
+
+
+def downgrade():
+    op.drop_table("rov_ratio")
@@ -0,0 +1,51 @@
+"""country_asn: cc -> ASN index derived from delegated_stats
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2023-10-23 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def _entries(bind):
+    rows = bind.execute(sa.text(
+        "SELECT cc, start, value FROM delegated_stats "
+        "WHERE type = 'asn' AND status IN ('assigned', 'allocated')"
+    ))
+    for cc, start, value in rows:
+        if not cc or cc in ("ZZ", "*") or not str(start).isdigit():
+            continue
+        count = int(value) if str(value).isdigit() else 1
+        for asn in range(int(start), int(start) + max(count, 1)):
+            yield cc.upper(), asn
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table("country_asn"):
+        op.create_table(
+            "country_asn",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("cc", sa.String, nullable=False),
+            sa.Column("asn", sa.Integer, nullable=False),
+        )
+    op.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_country_asn_cc_asn ON country_asn (cc, asn)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_country_asn_asn ON country_asn (asn, cc)")
+
+    if bind.execute(sa.text("SELECT 1 FROM country_asn LIMIT 1")).first() is None:
+        bind.exec_driver_sql(
+            "INSERT OR IGNORE INTO country_asn (cc, asn) VALUES (?, ?)", list(_entries(bind))
+        )
+
+
+def downgrade():
+    op.drop_table("country_asn")
@@ -0,0 +1,47 @@
+"""category_facet: precomputed ASN counts per (cc, category_1, category_2)
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2023-10-30 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table("category_facet"):
+        op.create_table(
+            "category_facet",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("cc", sa.String, nullable=False),
+            sa.Column("category_1", sa.String, nullable=False),
+            sa.Column("category_2", sa.String, nullable=False),
+            sa.Column("asn_count", sa.Integer, nullable=False),
+        )
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_category_facet_cc_categories "
+        "ON category_facet (cc, category_1, category_2)"
+    )
+
+    if bind.execute(sa.text("SELECT 1 FROM category_facet LIMIT 1")).first() is None:
+        op.execute(
+            "INSERT INTO category_facet (cc, category_1, category_2, asn_count) "
+            "SELECT COALESCE(country_asn.cc, 'ZZ'), COALESCE(categorized_asn.category_1, ''), "
+            "COALESCE(categorized_asn.category_2, ''), COUNT(*) "
+            "FROM categorized_asn "
+            "LEFT JOIN country_asn ON country_asn.asn = CAST(categorized_asn.asn AS INTEGER) "
+            "GROUP BY 1, 2, 3"
+        )
+
+
+def downgrade():
+    op.drop_table("category_facet")
@@ -0,0 +1,39 @@
+"""country_upstream: foreign transit dependencies per country and snapshot
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2023-11-06 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Table remplie par l'analyse (country_upstream_task) après chaque ingestion
+    if not sa.inspect(op.get_bind()).has_table("country_upstream"):
+        op.create_table(
+            "country_upstream",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("snapshot", sa.Integer, nullable=False),
+            sa.Column("cc", sa.String, nullable=False),
+            sa.Column("provider_asn", sa.Integer, nullable=False),
+            sa.Column("provider_cc", sa.String, nullable=False),
+            sa.Column("dependent_asns", sa.Integer, nullable=False),
+            sa.Column("share", sa.Float, nullable=False),
+        )
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_country_upstream_snapshot_cc "
+        "ON country_upstream (snapshot, cc, provider_asn)"
+    )
+
+
+def downgrade():
+    op.drop_table("country_upstream")
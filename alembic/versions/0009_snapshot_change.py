@@ -0,0 +1,43 @@
+"""snapshot_change: per-snapshot changelog of the ASNs touched by incremental ingests
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2023-11-20 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # NULL: rechargement complet, les caches sont vidés entièrement
+    if "changes" not in {column["name"] for column in inspector.get_columns("dataset_snapshot")}:
+        op.add_column("dataset_snapshot", sa.Column("changes", sa.Integer, nullable=True))
+    if not inspector.has_table("snapshot_change"):
+        op.create_table(
+            "snapshot_change",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("snapshot", sa.Integer, nullable=False),
+            sa.Column("table_name", sa.String, nullable=False),
+            sa.Column("asn", sa.String, nullable=False),
+            sa.Column("action", sa.String, nullable=False),
+        )
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_snapshot_change_snapshot_asn "
+        "ON snapshot_change (snapshot, asn, table_name, action)"
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS ix_snapshot_change_asn ON snapshot_change (asn, snapshot)")
+
+
+def downgrade():
+    op.drop_table("snapshot_change")
+    with op.batch_alter_table("dataset_snapshot") as batch_op:
+        batch_op.drop_column("changes")
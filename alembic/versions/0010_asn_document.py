@@ -0,0 +1,34 @@
+"""asn_document: merged /asn/ document of each ASN, serialized at ingest
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2023-11-27 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Table remplie par l'ingestion (update_asn_documents) ou build_database.py
+    if not sa.inspect(op.get_bind()).has_table("asn_document"):
+        op.create_table(
+            "asn_document",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("asn", sa.Integer, nullable=False),
+            sa.Column("snapshot", sa.Integer, nullable=False),
+            sa.Column("document", sa.LargeBinary, nullable=False),
+            sa.Column("siblings", sa.String, nullable=False),
+        )
+    op.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_asn_document_asn ON asn_document (asn)")
+
+
+def downgrade():
+    op.drop_table("asn_document")
@@ -0,0 +1,68 @@
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from .graph import AsGraph, PROVIDERS
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_COUNTRY = "ZZ"
+
+
+def _as_numpy(values) -> np.ndarray:
+    # Les tableaux array('I') du graphe sont lus sans copie
+    return np.frombuffer(values, dtype=np.uint32) if values.itemsize == 4 else np.asarray(values, dtype=np.uint32)
+
+
+def graph_edges(graph: AsGraph, kind: str):
+    """Paires (asn, voisin) d'un type de relation du graphe CSR, triées par asn."""
+    asns = _as_numpy(graph.asns).astype(np.int64)
+    offsets = _as_numpy(graph.offsets[kind])
+    targets = _as_numpy(graph.targets[kind])
+    owners = np.repeat(np.arange(len(asns)), np.diff(offsets))
+    return asns[owners], asns[targets]
+
+
+def provider_edges(graph: AsGraph) -> pd.DataFrame:
+    """Arêtes client -> fournisseur du graphe CSR, sous forme de deux colonnes d'ASN."""
+    customers, providers = graph_edges(graph, PROVIDERS)
+    return pd.DataFrame({"customer": customers, "provider": providers})
+
+
+def country_upstream_dependencies(edges: pd.DataFrame, countries: pd.DataFrame) -> pd.DataFrame:
+    """Fournisseurs étrangers de chaque pays, pondérés par le nombre d'ASN du pays qu'ils servent.
+
+    ``edges``: colonnes customer, provider; ``countries``: colonnes asn, cc.
+    Le résultat couvre tous les pays en une passe: cc, provider_asn,
+    provider_cc, dependent_asns et share (part des ASN du pays ayant au moins
+    un fournisseur).
+    """
+    countries = countries.astype({"asn": np.int64}).drop_duplicates("asn")
+    edges = edges.merge(countries.rename(columns={"asn": "customer"}), on="customer")
+    edges = edges.merge(
+        countries.rename(columns={"asn": "provider", "cc": "provider_cc"}), on="provider", how="left"
+    )
+    edges["provider_cc"] = edges["provider_cc"].fillna(UNKNOWN_COUNTRY)
+
+    domestic = edges.groupby("cc")["customer"].nunique()
+    foreign = edges[edges["provider_cc"] != edges["cc"]]
+    result = (
+        foreign.groupby(["cc", "provider", "provider_cc"], sort=False)["customer"].nunique()
+        .rename("dependent_asns")
+        .reset_index()
+        .rename(columns={"provider": "provider_asn"})
+    )
+    result["share"] = (result["dependent_asns"] / result["cc"].map(domestic)).round(6)
+    return result.sort_values(["cc", "dependent_asns", "provider_asn"], ascending=[True, False, True], ignore_index=True)
+
+
+def compute_country_upstreams(graph: AsGraph, countries: pd.DataFrame) -> pd.DataFrame:
+    started = time.perf_counter()
+    result = country_upstream_dependencies(provider_edges(graph), countries)
+    logger.info(
+        "Computed upstream dependencies: %d rows for %d countries in %.2fs",
+        len(result), result["cc"].nunique(), time.perf_counter() - started,
+    )
+    return result
@@ -0,0 +1,188 @@
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import literal_column, select
+from sqlalchemy.orm import Session
+
+from .function import iter_batches
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximum de paramètres liés par requête SQLite (999 avant la 3.32)
+SQLITE_MAX_VARIABLES = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def ensure_conflict_index(db: Session, table, index_elements: List[str]):
+    # Les bases générées par le notebook (pandas to_sql) n'ont aucun index:
+    # ON CONFLICT a besoin d'un index unique sur la cible
+    for index in table.indexes:
+        if index.unique and [c.name for c in index.columns] == list(index_elements):
+            index.create(bind=db.connection(), checkfirst=True)
+            return
+    raise ValueError(f"No unique index on {table.name}({', '.join(index_elements)})")
+
+
+def build_upsert_sql(table_name: str, columns: List[str], index_elements: List[str], row_count: int):
+    update_columns = [c for c in columns if c not in index_elements]
+    placeholders = "(" + ", ".join("?" * len(columns)) + ")"
+    column_list = ", ".join('"%s"' % c for c in columns)
+    conflict_list = ", ".join('"%s"' % c for c in index_elements)
+    sql = (
+        f'INSERT INTO "{table_name}" ({column_list}) '
+        f'VALUES {", ".join([placeholders] * row_count)} '
+        f'ON CONFLICT ({conflict_list}) '
+    )
+    if update_columns:
+        sql += "DO UPDATE SET " + ", ".join(f'"{c}" = excluded."{c}"' for c in update_columns)
+    else:
+        sql += "DO NOTHING"
+    return sql
+
+
+def _upsert_rows(cursor, table, columns, rows, index_elements, chunk_size):
+    # Le SQL d'un chunk complet n'est construit qu'une fois
+    statements = {}
+    total = 0
+    for chunk in iter_batches(rows, chunk_size):
+        if len(chunk) not in statements:
+            statements[len(chunk)] = build_upsert_sql(table.name, columns, index_elements, len(chunk))
+        cursor.execute(statements[len(chunk)], [row.get(c) for row in chunk for c in columns])
+        total += len(chunk)
+    return total
+
+
+def _chunk_size(columns, chunk_size):
+    return max(1, min(chunk_size, SQLITE_MAX_VARIABLES // len(columns)))
+
+
+def bulk_upsert(
+    db: Session,
+    table,
+    rows: Iterable[Dict[str, Any]],
+    index_elements: List[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+):
+    columns = [c.name for c in table.columns if not c.primary_key]
+
+    started = time.perf_counter()
+    try:
+        ensure_conflict_index(db, table, index_elements)
+        # Curseur DBAPI brut, dans la transaction de la session
+        cursor = db.connection().connection.cursor()
+        total = _upsert_rows(cursor, table, columns, rows, index_elements, _chunk_size(columns, chunk_size))
+        cursor.close()
+        # Une seule transaction par table
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        "table": table.name,
+        "rows": total,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(total / elapsed) if elapsed > 0 else total,
+    }
+    logger.info(
+        "Bulk upsert into %s: %d rows in %.2fs (%d rows/s)",
+        table.name, total, elapsed, stats["rows_per_second"],
+    )
+    return stats
+
+
+INSERTED = "insert"
+UPDATED = "update"
+DELETED = "delete"
+
+
+def diff_upsert(
+    db: Session,
+    table,
+    rows: Iterable[Dict[str, Any]],
+    index_elements: List[str],
+    scope=None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+):
+    """Applique un nouveau snapshot complet de ``table`` en n'écrivant que la différence.
+
+    Les lignes existantes (restreintes par la clause ``scope``) sont comparées
+    aux nouvelles sur la clé ``index_elements``: seules les lignes ajoutées ou
+    modifiées sont upsertées et les lignes disparues supprimées, dans une seule
+    transaction. Renvoie les statistiques et la liste des changements
+    ``(action, ancienne ligne, nouvelle ligne)``.
+    """
+    columns = [c.name for c in table.columns if not c.primary_key]
+    key_positions = [columns.index(c) for c in index_elements]
+
+    started = time.perf_counter()
+    # Lignes repérées par rowid: dans les bases du notebook, id n'est pas une
+    # clé primaire et reste NULL pour les lignes ajoutées par l'upsert
+    query = select([literal_column("rowid"), *[table.c[c] for c in columns]])
+    if scope is not None:
+        query = query.where(scope)
+    # Lecture par le curseur brut: des centaines de milliers de lignes à comparer
+    sql = str(query.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True}))
+    cursor = db.connection().connection.cursor()
+    existing = {}
+    for row in cursor.execute(sql):
+        values = row[1:]
+        existing[tuple(values[i] for i in key_positions)] = (row[0], values)
+    cursor.close()
+
+    # Doublons dans la source: la dernière ligne l'emporte, comme avec l'upsert
+    latest = {}
+    total = 0
+    for row in rows:
+        total += 1
+        values = tuple(map(row.get, columns))
+        latest[tuple(values[i] for i in key_positions)] = (values, row)
+
+    changes = []
+    pending = []
+    for key, (values, row) in latest.items():
+        previous = existing.pop(key, None)
+        if previous is None:
+            changes.append((INSERTED, None, row))
+        elif previous[1] != values:
+            changes.append((UPDATED, dict(zip(columns, previous[1])), row))
+        else:
+            continue
+        pending.append(row)
+    del latest
+    deleted = list(existing.values())
+    changes.extend((DELETED, dict(zip(columns, values)), None) for _, values in deleted)
+
+    try:
+        ensure_conflict_index(db, table, index_elements)
+        cursor = db.connection().connection.cursor()
+        _upsert_rows(cursor, table, columns, pending, index_elements, _chunk_size(columns, chunk_size))
+        for chunk in iter_batches([row_id for row_id, _ in deleted], SQLITE_MAX_VARIABLES):
+            cursor.execute(f'DELETE FROM "{table.name}" WHERE rowid IN ({", ".join("?" * len(chunk))})', chunk)
+        cursor.close()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    elapsed = time.perf_counter() - started
+    counts = {action: 0 for action in (INSERTED, UPDATED, DELETED)}
+    for action, _, _ in changes:
+        counts[action] += 1
+    stats = {
+        "table": table.name,
+        "rows": total,
+        "inserted": counts[INSERTED],
+        "updated": counts[UPDATED],
+        "deleted": counts[DELETED],
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(total / elapsed) if elapsed > 0 else total,
+    }
+    logger.info(
+        "Diff upsert into %s: %d rows compared, %d inserted, %d updated, %d deleted in %.2fs",
+        table.name, total, counts[INSERTED], counts[UPDATED], counts[DELETED], elapsed,
+    )
+    return stats, changes
@@ -0,0 +1,151 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional
+
+
+class CacheCounters:
+    """Succès et échecs cumulés d'un cache depuis le démarrage du processus."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+def cache_counters(name: str) -> CacheCounters:
+    # Partagés par les caches de même nom: le cache des cônes, recréé avec
+    # chaque graphe rechargé, ne remet pas ses compteurs à zéro
+    with _counters_lock:
+        counters = _counters.get(name)
+        if counters is None:
+            counters = _counters[name] = CacheCounters()
+        return counters
+
+
+class LRUCache:
+    """Cache LRU borné, associé à une version de snapshot.
+
+    Un changement de version vide le cache: une entrée ne survit jamais à
+    l'ingestion d'un nouveau jeu de données. Après une ingestion incrémentale,
+    ``invalidate`` passe à la nouvelle version en n'évinçant que les clés
+    modifiées et les entrées qui en dépendent (``depends_on`` de ``put``).
+
+    Avec ``maxbytes``, les valeurs sont des octets (réponses sérialisées) et le
+    cache est aussi borné par leur taille totale.
+    """
+
+    def __init__(self, name: str, maxsize: int, maxbytes: Optional[int] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.version = None
+        self.counters = cache_counters(name)
+        self.bytes = 0
+        self._entries = OrderedDict()
+        # clé modifiée -> entrées construites à partir d'elle, et l'inverse:
+        # les liens d'une entrée disparaissent avec elle
+        self._dependents = {}
+        self._dependencies = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _reset(self):
+        self._entries.clear()
+        self.bytes = 0
+        self._dependents.clear()
+        self._dependencies.clear()
+
+    def _check_version(self, version):
+        if version != self.version:
+            self._reset()
+            self.version = version
+
+    def _unlink(self, key):
+        for dependency in self._dependencies.pop(key, ()):
+            dependents = self._dependents.get(dependency)
+            if dependents is not None:
+                dependents.discard(key)
+                if not dependents:
+                    del self._dependents[dependency]
+
+    def _remove(self, key) -> bool:
+        self._unlink(key)
+        value = self._entries.pop(key, None)
+        if value is None:
+            return False
+        if self.maxbytes is not None:
+            self.bytes -= len(value)
+        return True
+
+    def get(self, key: Hashable, version=None) -> Optional[Any]:
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.counters.record(True)
+                return self._entries[key]
+            self.counters.record(False)
+            return None
+
+    def put(self, key: Hashable, value: Any, version=None, depends_on: Iterable[Hashable] = ()):
+        with self._lock:
+            self._check_version(version)
+            self._remove(key)
+            if self.maxbytes is not None:
+                # Une valeur plus grosse que le cache entier n'est pas gardée
+                if len(value) > self.maxbytes:
+                    return
+                self.bytes += len(value)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            dependencies = tuple(dependency for dependency in depends_on if dependency != key)
+            if dependencies:
+                self._dependencies[key] = dependencies
+                for dependency in dependencies:
+                    self._dependents.setdefault(dependency, set()).add(key)
+            while len(self._entries) > self.maxsize or (self.maxbytes is not None and self.bytes > self.maxbytes):
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, keys: Iterable[Hashable], version=None) -> int:
+        evicted = 0
+        with self._lock:
+            for key in keys:
+                for stale in (key, *self._dependents.pop(key, ())):
+                    if self._remove(stale):
+                        evicted += 1
+            self.version = version
+        return evicted
+
+    def clear(self):
+        # Aucune version associée: le prochain accès repart d'un cache froid
+        with self._lock:
+            self._reset()
+            self.version = None
+
+    def stats(self):
+        hits, misses = self.counters.hits, self.counters.misses
+        lookups = hits + misses
+        return {
+            "name": self.name,
+            "version": self.version,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "bytes": self.bytes,
+            "maxbytes": self.maxbytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
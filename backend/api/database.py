@@ -0,0 +1,375 @@
+from sqlalchemy import create_engine, event, Column, Integer, String, Float, LargeBinary, Index, inspect, func, or_
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime
+from typing import Optional, Set
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+
+from .bulk import bulk_upsert
+
+logger = logging.getLogger(__name__)
+
+# Créer le moteur de base de données SQLite
+SQLALCHEMY_DATABASE_URL = os.environ.get("MANRS_DATABASE_URL", "sqlite:///./manrs_2023-08/newdatabase.db")
+# Base servie en lecture seule (immutable): les mises à jour passent par publish_database
+DATABASE_READ_ONLY = os.environ.get("MANRS_DB_READ_ONLY", "").lower() in ("1", "true", "yes")
+
+# Réglages des connexions: lectures via mmap et grand cache de pages
+SQLITE_MMAP_SIZE = 1024 * 2 ** 20
+SQLITE_CACHE_SIZE_KIB = 256 * 1024
+
+
+def sqlite_path(url: str = SQLALCHEMY_DATABASE_URL) -> Optional[str]:
+    database = make_url(url).database
+    if not database or database == ":memory:":
+        return None
+    return os.path.abspath(database)
+
+def create_serving_engine(url: str = SQLALCHEMY_DATABASE_URL, read_only: bool = DATABASE_READ_ONLY):
+    path = sqlite_path(url)
+    if read_only and path:
+        # immutable: ni verrou ni relecture des changements, le fichier n'est jamais modifié en place
+        url = f"sqlite:///file:{path}?mode=ro&immutable=1&uri=true"
+    serving_engine = create_engine(url, connect_args={"check_same_thread": False})
+
+    @event.listens_for(serving_engine, "connect")
+    def tune_connection(connection, _):
+        cursor = connection.cursor()
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KIB}")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only = 1")
+        cursor.close()
+
+    return serving_engine
+
+def database_identity(path: Optional[str] = None):
+    # (périphérique, inode): change quand publish_database remplace le fichier
+    path = path or sqlite_path()
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return stat.st_dev, stat.st_ino
+
+engine = create_serving_engine()
+engine_identity = database_identity()
+_engine_lock = threading.Lock()
+
+# Déclarer la base de données
+Base = declarative_base()
+
+# Créer la session de base de données
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def refresh_engine() -> bool:
+    """Rouvre le moteur si le fichier servi a été remplacé; renvoie True dans ce cas.
+
+    Les sessions déjà ouvertes finissent sur l'ancien fichier (toujours lisible
+    tant qu'il est ouvert), les suivantes utilisent le nouveau.
+    """
+    global engine, engine_identity
+    identity = database_identity()
+    if identity is None or identity == engine_identity:
+        return False
+    with _engine_lock:
+        if identity == engine_identity:
+            return False
+        previous = engine
+        engine = create_serving_engine()
+        SessionLocal.configure(bind=engine)
+        engine_identity = identity
+        previous.dispose()
+    logger.info("Serving database replaced: reopened %s", sqlite_path())
+    return True
+
+def create_build_engine(path: str):
+    # Base en construction: WAL et écritures non synchronisées, puis publish_database
+    build_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+
+    @event.listens_for(build_engine, "connect")
+    def tune_connection(connection, _):
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KIB}")
+        cursor.close()
+
+    Base.metadata.create_all(bind=build_engine)
+    return build_engine
+
+def publish_database(build_path: str, serving_path: Optional[str] = None) -> str:
+    """Remplace atomiquement la base servie par ``build_path``.
+
+    Le WAL est d'abord intégré au fichier et la base repasse en journal
+    classique: le fichier publié se suffit à lui-même, sans -wal ni -shm qui
+    pourraient être associés au mauvais fichier après le renommage.
+    """
+    serving_path = os.path.abspath(serving_path or sqlite_path())
+    connection = sqlite3.connect(build_path)
+    try:
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        connection.execute("PRAGMA journal_mode = DELETE")
+        connection.execute("ANALYZE")
+        connection.commit()
+    finally:
+        connection.close()
+
+    # os.replace n'est atomique que dans un même système de fichiers
+    staged = build_path
+    if os.path.dirname(os.path.abspath(build_path)) != os.path.dirname(serving_path):
+        staged = f"{serving_path}.publish"
+        shutil.copyfile(build_path, staged)
+    with open(staged, "rb") as file:
+        os.fsync(file.fileno())
+    os.replace(staged, serving_path)
+    directory = os.open(os.path.dirname(serving_path), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+    logger.info("Published %s to %s", build_path, serving_path)
+    return serving_path
+
+# Modèle de données pour la table 'merged_df'
+    
+
+
+class DatasetASMappingTable(Base):
+    __tablename__ = "dataset_as_mapping"
+
+    id = Column(Integer, primary_key=True)
+    asn = Column(String, nullable=True, unique=True, index=True)
+    status = Column(String, nullable=True)
+    reference_orgs = Column(String, nullable=True)  # Stocker une liste de références d'organisations au format JSON
+    sibling_asns = Column(String, nullable=True)     # Stocker une liste de frères ASN au format JSON
+    name = Column(String, nullable=True)
+    descr = Column(String, nullable=True)
+    website = Column(String, nullable=True)
+    comparison_with_ca2O = Column(String, nullable=True)
+    comparison_with_pdb = Column(String, nullable=True)
+    pdb_org_id = Column(String, nullable=True)
+    pdb_org = Column(String, nullable=True)
+    
+class DelegatedStatsTable(Base):
+    __tablename__ = "delegated_stats"
+    __table_args__ = (
+        Index("ix_delegated_stats_resource", "registry", "type", "start", unique=True),
+        # Index couvrants: pays d'un ASN et ASN d'un pays
+        Index("ix_delegated_stats_asn_lookup", "type", "start", "cc"),
+        Index("ix_delegated_stats_country", "cc", "type", "start", "value"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    registry = Column(String, nullable=True)
+    cc = Column(String, nullable=True)
+    type = Column(String, nullable=True)
+    start = Column(String, nullable=True)
+    value = Column(String, nullable=True)
+    date = Column(String, nullable=True)
+    status = Column(String, nullable=True)
+    opaque_id = Column(String, nullable=True)
+    extensions = Column(String, nullable=True)
+    
+class CategorizedAsnTable(Base):
+    __tablename__ = "categorized_asn"
+    __table_args__ = (
+        Index("ix_categorized_asn_categories", "category_1", "category_2", "asn"),
+        Index("ix_categorized_asn_category_2", "category_2", "asn"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    asn = Column(String, unique=True, index=True)
+    category_1 = Column(String, nullable=True)
+    category_2 = Column(String, nullable=True)
+
+class RelationshipAsnTable(Base):
+    __tablename__ = "relationship_asn"
+
+    id = Column(Integer, primary_key=True)
+    asn = Column(String, unique=True, index=True)
+    customers = Column(String, nullable=True)
+    providers = Column(String, nullable=True)
+
+# Relations normalisées: une ligne par (asn, type de relation, asn lié)
+class RelatedAsnTable(Base):
+    __tablename__ = "related_asn"
+    __table_args__ = (
+        Index("ix_related_asn_forward", "asn", "kind", "related_asn", unique=True),
+        Index("ix_related_asn_reverse", "related_asn", "kind", "asn"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    asn = Column(String, nullable=False)
+    kind = Column(String, nullable=False)
+    related_asn = Column(String, nullable=False)
+
+# Index pays -> ASN dérivé de delegated_stats (blocs type=asn dépliés)
+class CountryAsnTable(Base):
+    __tablename__ = "country_asn"
+    __table_args__ = (
+        Index("ix_country_asn_cc_asn", "cc", "asn", unique=True),
+        Index("ix_country_asn_asn", "asn", "cc"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    cc = Column(String, nullable=False)
+    asn = Column(Integer, nullable=False)
+
+# Nombre d'ASN par (pays, catégorie 1, catégorie 2), recalculé à l'ingestion
+class CategoryFacetTable(Base):
+    __tablename__ = "category_facet"
+    __table_args__ = (
+        Index("ix_category_facet_cc_categories", "cc", "category_1", "category_2", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    cc = Column(String, nullable=False)
+    category_1 = Column(String, nullable=False)
+    category_2 = Column(String, nullable=False)
+    asn_count = Column(Integer, nullable=False)
+
+# Fournisseurs étrangers dont dépendent les ASN d'un pays, par snapshot
+class CountryUpstreamTable(Base):
+    __tablename__ = "country_upstream"
+    __table_args__ = (
+        Index("ix_country_upstream_snapshot_cc", "snapshot", "cc", "provider_asn", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    snapshot = Column(Integer, nullable=False)
+    cc = Column(String, nullable=False)
+    provider_asn = Column(Integer, nullable=False)
+    provider_cc = Column(String, nullable=False)
+    dependent_asns = Column(Integer, nullable=False)
+    share = Column(Float, nullable=False)
+
+# Série temporelle des ratios ROV RoVista (overview.json et CSV par ASN)
+class RovRatioTable(Base):
+    __tablename__ = "rov_ratio"
+    __table_args__ = (
+        Index("ix_rov_ratio_asn_date", "asn", "date", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    asn = Column(String, nullable=False)
+    date = Column(String, nullable=False)
+    ratio = Column(Float, nullable=True)
+
+# Une ligne par ingestion validée: la plus récente donne la version servie
+class DatasetSnapshotTable(Base):
+    __tablename__ = "dataset_snapshot"
+
+    id = Column(Integer, primary_key=True)
+    source = Column(String, nullable=True)
+    created_at = Column(String, nullable=True)
+    # Nombre d'ASN touchés pour une ingestion incrémentale, NULL pour un rechargement complet
+    changes = Column(Integer, nullable=True)
+
+# Journal des ASN modifiés par chaque snapshot incrémental
+class SnapshotChangeTable(Base):
+    __tablename__ = "snapshot_change"
+    __table_args__ = (
+        Index("ix_snapshot_change_snapshot_asn", "snapshot", "asn", "table_name", "action", unique=True),
+        Index("ix_snapshot_change_asn", "asn", "snapshot"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    snapshot = Column(Integer, nullable=False)
+    table_name = Column(String, nullable=False)
+    asn = Column(String, nullable=False)
+    action = Column(String, nullable=False)
+
+# Document /asn/ de chaque ASN, sérialisé en JSON à l'ingestion; les frères sont
+# gardés en liste (JSON) et développés à la lecture à partir de leurs propres lignes
+class AsnDocumentTable(Base):
+    __tablename__ = "asn_document"
+    __table_args__ = (
+        Index("ix_asn_document_asn", "asn", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    asn = Column(Integer, nullable=False)
+    snapshot = Column(Integer, nullable=False)
+    document = Column(LargeBinary, nullable=False)
+    siblings = Column(String, nullable=False)
+
+SIBLING = "sibling"
+PROVIDER = "provider"
+CUSTOMER = "customer"
+PEER = "peer"
+RELATED_KINDS = (SIBLING, PROVIDER, CUSTOMER, PEER)
+# Champ du document fusionné alimenté par chaque type de relation
+RELATED_FIELDS = {SIBLING: "sibling_asns", PROVIDER: "providers", CUSTOMER: "customers", PEER: "peers"}
+
+
+def current_snapshot_version(db) -> int:
+    return db.query(func.max(DatasetSnapshotTable.id)).scalar() or 0
+
+def record_snapshot(db, source: str, changelog=None) -> int:
+    # changelog: entrées (table, action, asn) d'une ingestion incrémentale,
+    # écrites dans la même transaction que le snapshot
+    snapshot = DatasetSnapshotTable(source=source, created_at=datetime.now().isoformat())
+    if changelog is not None:
+        snapshot.changes = len({asn for _, _, asn in changelog})
+    db.add(snapshot)
+    if changelog:
+        db.flush()
+        rows = (
+            {"snapshot": snapshot.id, "table_name": table_name, "asn": asn, "action": action}
+            for table_name, action, asn in changelog
+        )
+        bulk_upsert(db, SnapshotChangeTable.__table__, rows, ["snapshot", "asn", "table_name", "action"])
+    db.commit()
+    return snapshot.id
+
+def relationship_snapshot(db) -> str:
+    # Dernier chargement qui a modifié les relations: version du graphe binaire
+    snapshot = db.query(DatasetSnapshotTable).filter(
+        DatasetSnapshotTable.source == "relationship_asn",
+        or_(DatasetSnapshotTable.changes.is_(None), DatasetSnapshotTable.changes > 0),
+    ).order_by(DatasetSnapshotTable.id.desc()).first()
+    return f"{snapshot.id}:{snapshot.created_at}" if snapshot else ""
+
+def changed_asns_since(db, version: int, snapshot: int) -> Optional[Set[str]]:
+    # None si un snapshot intermédiaire est un rechargement complet (pas de journal)
+    full_reloads = db.query(DatasetSnapshotTable.id).filter(
+        DatasetSnapshotTable.id > version,
+        DatasetSnapshotTable.id <= snapshot,
+        DatasetSnapshotTable.changes.is_(None),
+    ).first()
+    if full_reloads is not None:
+        return None
+    return {
+        row.asn
+        for row in db.query(SnapshotChangeTable.asn).filter(
+            SnapshotChangeTable.snapshot > version, SnapshotChangeTable.snapshot <= snapshot
+        ).distinct()
+    }
+
+def find_missing_indexes(bind):
+    # Index déclarés dans les modèles mais absents de la base servie
+    inspector = inspect(bind)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing.extend(f"{table.name}.{index.name}" for index in table.indexes if index.name not in existing)
+    return missing
+
+def check_indexes(bind):
+    missing = find_missing_indexes(bind)
+    if missing:
+        logger.warning(
+            "Database is missing %d lookup indexes (%s): run `alembic upgrade head`",
+            len(missing), ", ".join(missing),
+        )
+    return missing
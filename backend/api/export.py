@@ -0,0 +1,239 @@
+import csv
+import io
+import json
+import logging
+import os
+import threading
+import time
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy.orm import Session
+
+from .analysis import graph_edges
+from .database import DatasetSnapshotTable, SIBLING, PROVIDER, CUSTOMER
+from .graph import AsGraph, PROVIDERS, CUSTOMERS
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.environ.get("MANRS_EXPORT_DIR", "exports")
+EXPORT_FORMATS = {
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+}
+EXPORT_COMPRESSION = "zstd"
+EXPORT_CHUNK_SIZE = 1024 * 1024
+EXPORT_PREFIX = "manrs-asns-"
+
+# Exports en flux des listes pays/catégorie: un document ASN par ligne
+STREAM_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+STREAM_CSV_FIELDS = [
+    "asn", "org_name", "website", "country_code", "category_1", "category_2",
+    "sibling_asns", "providers", "customers", "ratio_rov", "ratio_rov_date",
+]
+
+# Un seul export à la fois: les requêtes concurrentes attendent le même fichier
+_export_lock = threading.Lock()
+
+# ASN numériques uniquement: les tables les stockent en chaîne
+def numeric(column: str = "asn") -> str:
+    return f"{column} <> '' AND {column} NOT GLOB '*[^0-9]*'"
+
+
+NUMERIC_ASN = numeric()
+
+ASN_UNIVERSE_SQL = f"""
+    SELECT CAST(asn AS INTEGER) FROM dataset_as_mapping WHERE {NUMERIC_ASN}
+    UNION SELECT CAST(asn AS INTEGER) FROM categorized_asn WHERE {NUMERIC_ASN}
+    UNION SELECT asn FROM country_asn
+    UNION SELECT CAST(asn AS INTEGER) FROM rov_ratio WHERE {NUMERIC_ASN}
+    UNION SELECT CAST(asn AS INTEGER) FROM related_asn WHERE {NUMERIC_ASN}
+"""
+
+LATEST_ROV_SQL = f"""
+    SELECT CAST(r.asn AS INTEGER), r.date, r.ratio
+    FROM rov_ratio r
+    JOIN (SELECT asn, MAX(date) AS date FROM rov_ratio GROUP BY asn) latest
+      ON latest.asn = r.asn AND latest.date = r.date
+    WHERE {numeric('r.asn')}
+"""
+
+
+def _fetch(db: Session, sql: str, params=(), columns=None) -> pd.DataFrame:
+    cursor = db.connection().connection.cursor()
+    try:
+        return pd.DataFrame.from_records(cursor.execute(sql, params).fetchall(), columns=columns)
+    finally:
+        cursor.close()
+
+
+def _list_column(asns: np.ndarray, owners: np.ndarray, values: np.ndarray) -> pa.ListArray:
+    # asns trié; la liste de asns[i] est values[offsets[i]:offsets[i + 1]]
+    keep = np.isin(owners, asns)
+    order = np.argsort(owners[keep], kind="stable")
+    owners, values = owners[keep][order], values[keep][order]
+    offsets = np.searchsorted(owners, asns, side="left").astype(np.int32)
+    offsets = np.append(offsets, np.int32(len(values)))
+    return pa.ListArray.from_arrays(pa.array(offsets), pa.array(values.astype(np.uint32)))
+
+
+def _related_column(db: Session, asns: np.ndarray, kind: str) -> pa.ListArray:
+    frame = _fetch(
+        db,
+        f"SELECT CAST(asn AS INTEGER), CAST(related_asn AS INTEGER) FROM related_asn "
+        f"WHERE kind = ? AND {NUMERIC_ASN} AND {numeric('related_asn')}",
+        (kind,),
+        ["asn", "related_asn"],
+    )
+    return _list_column(asns, frame["asn"].to_numpy(np.int64), frame["related_asn"].to_numpy(np.int64))
+
+
+def _strings(values: pd.Series) -> pa.StringArray:
+    return pa.array(values.fillna("").astype(str), type=pa.string())
+
+
+def _dictionary(values: pd.Series) -> pa.DictionaryArray:
+    return _strings(values).dictionary_encode()
+
+
+def build_asn_table(db: Session, graph: Optional[AsGraph] = None) -> pa.Table:
+    """Jeu de données fusionné (un document /asn/ par ligne) au format Arrow.
+
+    Relations en colonnes liste d'ASN, pays et catégories encodés en
+    dictionnaire. Fournisseurs et clients viennent du graphe quand il est
+    chargé, sinon de related_asn.
+    """
+    asns = np.sort(_fetch(db, ASN_UNIVERSE_SQL, columns=["asn"])["asn"].to_numpy(np.int64))
+    frame = pd.DataFrame({"asn": asns})
+
+    mapping = _fetch(
+        db, f"SELECT CAST(asn AS INTEGER), name, website FROM dataset_as_mapping WHERE {NUMERIC_ASN}",
+        columns=["asn", "org_name", "website"],
+    )
+    country = _fetch(db, "SELECT asn, MIN(cc) FROM country_asn GROUP BY asn", columns=["asn", "country_code"])
+    categories = _fetch(
+        db, f"SELECT CAST(asn AS INTEGER), category_1, category_2 FROM categorized_asn WHERE {NUMERIC_ASN}",
+        columns=["asn", "category_1", "category_2"],
+    )
+    rov = _fetch(db, LATEST_ROV_SQL, columns=["asn", "ratio_rov_date", "ratio_rov"])
+    for other in (mapping, country, categories, rov):
+        frame = frame.merge(other.drop_duplicates("asn"), on="asn", how="left")
+
+    if graph is not None:
+        providers = _list_column(asns, *graph_edges(graph, PROVIDERS))
+        customers = _list_column(asns, *graph_edges(graph, CUSTOMERS))
+    else:
+        providers = _related_column(db, asns, PROVIDER)
+        customers = _related_column(db, asns, CUSTOMER)
+
+    return pa.table({
+        "asn": pa.array(asns.astype(np.uint32)),
+        "org_name": _strings(frame["org_name"]),
+        "website": _strings(frame["website"]),
+        "country_code": _dictionary(frame["country_code"]),
+        "category_1": _dictionary(frame["category_1"]),
+        "category_2": _dictionary(frame["category_2"]),
+        "sibling_asns": _related_column(db, asns, SIBLING),
+        "providers": providers,
+        "customers": customers,
+        "ratio_rov": pa.array(frame["ratio_rov"].astype(float), type=pa.float64(), from_pandas=True),
+        "ratio_rov_date": pa.array(frame["ratio_rov_date"], type=pa.string(), from_pandas=True),
+    })
+
+
+def export_path(db: Session, fmt: str, directory: str = EXPORT_DIR) -> str:
+    # Snapshot et date de création: deux bases différentes n'ont jamais le même nom
+    snapshot = db.query(DatasetSnapshotTable).order_by(DatasetSnapshotTable.id.desc()).first()
+    version = f"{snapshot.id}-{snapshot.created_at.replace(':', '').replace('-', '')[:15]}" if snapshot else "0"
+    return os.path.join(directory, f"{EXPORT_PREFIX}{version}.{EXPORT_FORMATS[fmt][0]}")
+
+
+def remove_stale_exports(path: str) -> int:
+    # Exports des snapshots précédents, tous formats; ceux du snapshot de path
+    # sont gardés. Un téléchargement en cours garde son fichier ouvert.
+    directory, name = os.path.split(path)
+    version = name.split(".", 1)[0]
+    extensions = {extension for extension, _ in EXPORT_FORMATS.values()}
+    removed = 0
+    for entry in os.listdir(directory):
+        stem, _, extension = entry.partition(".")
+        if not stem.startswith(EXPORT_PREFIX) or stem == version or extension not in extensions:
+            continue
+        try:
+            os.remove(os.path.join(directory, entry))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def write_export(table: pa.Table, path: str, fmt: str):
+    tmp_path = f"{path}.tmp"
+    if fmt == "parquet":
+        pq.write_table(table, tmp_path, compression=EXPORT_COMPRESSION)
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=EXPORT_COMPRESSION)
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def export_snapshot(db: Session, fmt: str = "parquet", graph: Optional[AsGraph] = None, directory: str = EXPORT_DIR) -> str:
+    """Chemin du fichier d'export du snapshot courant, construit au premier appel."""
+    path = export_path(db, fmt, directory)
+    if os.path.exists(path):
+        return path
+    with _export_lock:
+        if os.path.exists(path):
+            return path
+        started = time.perf_counter()
+        os.makedirs(directory, exist_ok=True)
+        table = build_asn_table(db, graph)
+        write_export(table, path, fmt)
+        # Fichier du nouveau snapshot en place: les précédents ne servent plus
+        removed = remove_stale_exports(path)
+        logger.info(
+            "Exported %d ASNs to %s (%.1f MiB) in %.2fs, %d stale export(s) removed",
+            table.num_rows, path, os.path.getsize(path) / 2 ** 20, time.perf_counter() - started, removed,
+        )
+    return path
+
+
+def iter_export_chunks(path: str, chunk_size: int = EXPORT_CHUNK_SIZE):
+    # Le fichier est ouvert une fois: un remplacement pendant l'envoi ne le coupe pas
+    with open(path, "rb") as file:
+        yield from iter(lambda: file.read(chunk_size), b"")
+
+
+def iter_ndjson(records: Iterable[Iterable[dict]]):
+    # records: lots de documents; un morceau de réponse par lot
+    for batch in records:
+        yield "".join(json.dumps(record) + "\n" for record in batch)
+
+
+def csv_row(record: dict):
+    ratio = record.get("ratio_rov") or {}
+    row = dict(record, ratio_rov=ratio.get("ratio"), ratio_rov_date=ratio.get("date"))
+    for field in ("sibling_asns", "providers", "customers"):
+        row[field] = " ".join(str(asn) for asn in record.get(field) or [])
+    return row
+
+
+def iter_csv(records: Iterable[Iterable[dict]]):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, STREAM_CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for batch in records:
+        writer.writerows(csv_row(record) for record in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_stream_export(records: Iterable[Iterable[dict]], fmt: str):
+    return iter_ndjson(records) if fmt == "ndjson" else iter_csv(records)
@@ -1,5 +1,9 @@
+import bz2
 import json
 import csv
+from typing import Any, Iterable, Iterator, List
+
+JSON_READ_CHUNK_SIZE = 64 * 1024
 
 def read_file_and_extract_content(file_path: str):
     with open(file_path, "r") as file:
@@ -16,12 +20,148 @@ def read_file_and_extract_content(file_path: str):
     return content
 
 def read_csv(file):
-    data_list = []
-    csv_reader = csv.DictReader(file)
-    for row in csv_reader:
-            data_list.append(row)
-    return data_list
+    return list(iter_csv(file))
 
 def read_txt(file):
-    content = [line.strip() for line in file.readlines()]
-    return content
+    return list(iter_txt(file))
+
+
+# Lecture en flux: la mémoire reste constante quelle que soit la taille du fichier
+def iter_file_content(file_path: str) -> Iterator[Any]:
+    # Un .bz2 est décompressé à la volée; le format suit l'extension intérieure
+    if file_path.endswith(".bz2"):
+        file = bz2.open(file_path, "rt")
+        file_path = file_path[:-len(".bz2")]
+    else:
+        file = open(file_path, "r")
+    with file:
+        if file_path.endswith(".json"):
+            yield from iter_json(file)
+        elif file_path.endswith(".csv"):
+            yield from iter_csv(file)
+        else:
+            yield from iter_txt(file)
+
+def iter_batches(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def iter_csv(file):
+    yield from csv.DictReader(file)
+
+def iter_txt(file):
+    for line in file:
+        yield line.strip()
+
+def iter_json(file, chunk_size: int = JSON_READ_CHUNK_SIZE):
+    # Objet de premier niveau: paires (clé, valeur); tableau: ses éléments
+    reader = _JsonStreamReader(file, chunk_size)
+    if reader.peek() == "[":
+        return _iter_json_array(reader)
+    return _iter_json_object(reader)
+
+def iter_json_items(file, chunk_size: int = JSON_READ_CHUNK_SIZE):
+    # Produit les paires (clé, valeur) d'un objet JSON de premier niveau
+    # sans charger le document entier
+    return _iter_json_object(_JsonStreamReader(file, chunk_size))
+
+def iter_json_array(file, chunk_size: int = JSON_READ_CHUNK_SIZE):
+    return _iter_json_array(_JsonStreamReader(file, chunk_size))
+
+def _iter_json_object(reader):
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.decode()
+        reader.expect(":")
+        value = reader.decode()
+        yield key, value
+        separator = reader.next_char()
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or '}}' in JSON object, got {separator!r}")
+
+def _iter_json_array(reader):
+    reader.expect("[")
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.decode()
+        separator = reader.next_char()
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' in JSON array, got {separator!r}")
+
+
+class _JsonStreamReader:
+    _whitespace = " \t\n\r"
+    # Caractères qui peuvent prolonger un nombre: 12 suivi de ".75", 1 suivi de "e10"
+    _number_chars = "0123456789+-.eE"
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, file, chunk_size: int):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def _skip_whitespace(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self._whitespace:
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return
+            self._fill()
+
+    def peek(self):
+        self._skip_whitespace()
+        return self.buffer[self.pos] if self.pos < len(self.buffer) else ""
+
+    def next_char(self):
+        char = self.peek()
+        self.pos += len(char)
+        return char
+
+    def expect(self, char: str):
+        found = self.next_char()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, got {found!r}")
+
+    def decode(self):
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            # Un nombre coupé par la fin du tampon est décodé tronqué ("12." -> 12):
+            # on relit tant qu'il touche la fin ou qu'un caractère de nombre le suit
+            if not self.eof and (
+                end == len(self.buffer)
+                or (isinstance(value, (int, float)) and self.buffer[end] in self._number_chars)
+            ):
+                self._fill()
+                continue
+            self.pos = end
+            return value
@@ -0,0 +1,301 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from typing import Iterable, List, Optional, Tuple
+
+from .cache import LRUCache
+from .function import iter_file_content
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = "providers"
+CUSTOMERS = "customers"
+PEERS = "peers"
+EDGE_KINDS = (PROVIDERS, CUSTOMERS, PEERS)
+
+# Relations CAIDA: <provider-as>|<customer-as>|-1 et <peer-as>|<peer-as>|0
+PROVIDER_TO_CUSTOMER = -1
+PEER_TO_PEER = 0
+
+# Limites d'un parcours de cône (supply chain)
+CONE_MAX_NODES = 20000
+CONE_TIME_BUDGET = 0.05
+CONE_CACHE_SIZE = 1024
+
+# Snapshot binaire: en-tête fixe (magic, format, longueur du JSON), en-tête JSON,
+# puis les tableaux uint32 bruts alignés sur 8 octets
+GRAPH_MAGIC = b"MANRSCSR"
+GRAPH_FORMAT_VERSION = 1
+GRAPH_HEADER = struct.Struct("<8sII")
+
+
+def parse_asn(asn) -> Optional[int]:
+    try:
+        value = int(str(asn).strip().upper().replace("AS", ""))
+    except ValueError:
+        return None
+    return value if 0 <= value < 2 ** 32 else None
+
+
+class AsGraph:
+    """Graphe AS en CSR: ASN triés + (offsets, cibles) par type de relation.
+
+    Les cibles sont des indices dans ``asns``; les voisins d'un ASN sont
+    ``targets[kind][offsets[kind][i]:offsets[kind][i + 1]]``.
+    """
+
+    def __init__(self, asns, offsets, targets, version: Optional[str] = None):
+        self.asns = asns
+        self.offsets = offsets
+        self.targets = targets
+        self.version = version
+        # Cônes mémorisés pour ce snapshot: un nouveau graphe repart à vide
+        self.cone_cache = LRUCache("supply_chain_cones", CONE_CACHE_SIZE)
+
+    @classmethod
+    def from_edges(cls, edges: Iterable[Tuple[int, int, int]], version: Optional[str] = None):
+        sources = array("I")
+        destinations = array("I")
+        relations = array("b")
+        nodes = set()
+        for source, destination, relation in edges:
+            if source == destination:
+                continue
+            sources.append(source)
+            destinations.append(destination)
+            relations.append(relation)
+            nodes.add(source)
+            nodes.add(destination)
+
+        asns = array("I", sorted(nodes))
+        index = {asn: i for i, asn in enumerate(asns)}
+        del nodes
+        sources = array("I", map(index.__getitem__, sources))
+        destinations = array("I", map(index.__getitem__, destinations))
+        del index
+
+        # Liste d'adjacence orientée (noeud, voisin) pour chaque type de relation
+        def directed(kind):
+            if kind == PEERS:
+                for source, destination, relation in zip(sources, destinations, relations):
+                    if relation == PEER_TO_PEER:
+                        yield source, destination
+                        yield destination, source
+                return
+            for source, destination, relation in zip(sources, destinations, relations):
+                if relation == PROVIDER_TO_CUSTOMER:
+                    if kind == PROVIDERS:
+                        yield destination, source
+                    else:
+                        yield source, destination
+
+        offsets = {}
+        targets = {}
+        for kind in EDGE_KINDS:
+            counts = array("I", bytes(4 * (len(asns) + 1)))
+            for node, _ in directed(kind):
+                counts[node + 1] += 1
+            for i in range(1, len(counts)):
+                counts[i] += counts[i - 1]
+            cursor = array("I", counts)
+            neighbors = array("I", bytes(4 * counts[-1]))
+            for node, neighbor in directed(kind):
+                neighbors[cursor[node]] = neighbor
+                cursor[node] += 1
+            offsets[kind] = counts
+            targets[kind] = neighbors
+        return cls(asns, offsets, targets, version)
+
+    @classmethod
+    def from_as_rel_file(cls, file_path: str, version: Optional[str] = None):
+        return cls.from_edges(iter_as_rel_edges(iter_file_content(file_path)), version)
+
+    @classmethod
+    def load(cls, path: str):
+        """Ouvre un snapshot écrit par ``save`` sans le lire: les tableaux sont
+        des vues sur un mmap en lecture seule, partagé entre les processus.
+        """
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size < GRAPH_HEADER.size:
+                raise ValueError(f"{path}: truncated graph snapshot")
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, format_version, header_length = GRAPH_HEADER.unpack_from(mapped)
+        if magic != GRAPH_MAGIC or format_version != GRAPH_FORMAT_VERSION:
+            raise ValueError(f"{path}: not a graph snapshot (format {GRAPH_FORMAT_VERSION})")
+        header = json.loads(mapped[GRAPH_HEADER.size:GRAPH_HEADER.size + header_length])
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path}: written on a {header['byteorder']}-endian machine")
+
+        # Positions relatives au début des données
+        view = memoryview(mapped)[_data_start(header_length):]
+        arrays = {
+            name: view[start:start + 4 * length].cast("I")
+            for name, (start, length) in header["arrays"].items()
+        }
+        offsets = {kind: arrays[f"offsets.{kind}"] for kind in EDGE_KINDS}
+        targets = {kind: arrays[f"targets.{kind}"] for kind in EDGE_KINDS}
+        return cls(arrays["asns"], offsets, targets, header["version"])
+
+    def save(self, path: str):
+        # Fichier temporaire propre au processus puis os.replace: un lecteur voit
+        # l'ancien snapshot ou le nouveau, jamais un fichier partiel
+        arrays = {"asns": self.asns}
+        arrays.update((f"offsets.{kind}", self.offsets[kind]) for kind in EDGE_KINDS)
+        arrays.update((f"targets.{kind}", self.targets[kind]) for kind in EDGE_KINDS)
+        layout = {}
+        position = 0
+        for name, values in arrays.items():
+            layout[name] = (position, len(values))
+            position += 4 * len(values)
+        header = json.dumps({"version": self.version, "byteorder": sys.byteorder, "arrays": layout}).encode()
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(GRAPH_HEADER.pack(GRAPH_MAGIC, GRAPH_FORMAT_VERSION, len(header)))
+            file.write(header)
+            file.write(bytes(_data_start(len(header)) - GRAPH_HEADER.size - len(header)))
+            for values in arrays.values():
+                file.write(values)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self.asns)
+
+    def __contains__(self, asn):
+        return self.index_of(asn) is not None
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets[CUSTOMERS]) + len(self.targets[PEERS]) // 2
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.asns, *self.offsets.values(), *self.targets.values()]
+        return sum(a.itemsize * len(a) for a in arrays)
+
+    def index_of(self, asn) -> Optional[int]:
+        value = parse_asn(asn)
+        if value is None:
+            return None
+        i = bisect_left(self.asns, value)
+        if i < len(self.asns) and self.asns[i] == value:
+            return i
+        return None
+
+    def neighbor_indices(self, index: int, kind: str):
+        offsets = self.offsets[kind]
+        return self.targets[kind][offsets[index]:offsets[index + 1]]
+
+    def neighbors(self, asn, kind: str) -> List[int]:
+        index = self.index_of(asn)
+        if index is None:
+            return []
+        return [self.asns[i] for i in self.neighbor_indices(index, kind)]
+
+    def providers(self, asn) -> List[int]:
+        return self.neighbors(asn, PROVIDERS)
+
+    def customers(self, asn) -> List[int]:
+        return self.neighbors(asn, CUSTOMERS)
+
+    def peers(self, asn) -> List[int]:
+        return self.neighbors(asn, PEERS)
+
+    def cone(
+        self,
+        asn,
+        kind: str = PROVIDERS,
+        max_depth: Optional[int] = None,
+        max_nodes: int = CONE_MAX_NODES,
+        time_budget: float = CONE_TIME_BUDGET,
+    ) -> Optional[dict]:
+        """Parcours en largeur des fournisseurs (ou clients) transitifs d'un ASN.
+
+        Chaque noeud est rendu avec sa profondeur et l'ASN par lequel il a été
+        atteint. Le parcours s'arrête à ``max_depth``, ``max_nodes`` ou après
+        ``time_budget`` secondes; ``truncated`` indique alors la limite atteinte.
+        """
+        start = self.index_of(asn)
+        if start is None:
+            return None
+        key = (start, kind, max_depth, max_nodes)
+        cached = self.cone_cache.get(key)
+        if cached is not None:
+            return cached
+
+        offsets = self.offsets[kind]
+        targets = self.targets[kind]
+        asns = self.asns
+        deadline = time.perf_counter() + time_budget
+        seen = {start}
+        frontier = [start]
+        nodes = []
+        truncated = None
+        depth = 0
+        while frontier and truncated is None and (max_depth is None or depth < max_depth):
+            depth += 1
+            next_frontier = []
+            for node in frontier:
+                for neighbor in targets[offsets[node]:offsets[node + 1]]:
+                    if neighbor in seen:
+                        continue
+                    seen.add(neighbor)
+                    next_frontier.append(neighbor)
+                    nodes.append({"asn": asns[neighbor], "depth": depth, "via": asns[node]})
+                    if len(nodes) >= max_nodes:
+                        truncated = "max_nodes"
+                        break
+                if truncated is None and time.perf_counter() > deadline:
+                    truncated = "time_budget"
+                if truncated is not None:
+                    break
+            frontier = next_frontier
+
+        result = {
+            "asn": asns[start],
+            "direction": kind,
+            "depth": depth,
+            "total_results": len(nodes),
+            "truncated": truncated,
+            "results": nodes,
+        }
+        # Un résultat coupé par le temps dépend de la charge: on ne le garde pas
+        if truncated != "time_budget":
+            self.cone_cache.put(key, result)
+        return result
+
+
+def _data_start(header_length: int) -> int:
+    return -(-(GRAPH_HEADER.size + header_length) // 8) * 8
+
+
+def iter_as_rel_edges(lines: Iterable[str]):
+    for line in lines:
+        if not line or line.startswith("#"):
+            continue
+        fields = line.strip().split("|")
+        if len(fields) < 3:
+            continue
+        source, destination = parse_asn(fields[0]), parse_asn(fields[1])
+        if source is None or destination is None:
+            continue
+        try:
+            relation = int(fields[2])
+        except ValueError:
+            continue
+        yield source, destination, relation
+
+
+def log_graph_loaded(graph: AsGraph, source: str, started: float):
+    logger.info(
+        "Loaded AS relationship graph from %s: %d ASNs, %d edges, %.1f MiB in %.2fs",
+        source, len(graph), graph.edge_count, graph.nbytes / 2 ** 20, time.perf_counter() - started,
+    )
@@ -1,117 +1,62 @@
-from fastapi import FastAPI, HTTPException, Query, Depends, BackgroundTasks
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Float, Date
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship, Session
-from typing import List, Dict, Any
+from fastapi import FastAPI, HTTPException, Query, Depends
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import func, cast, Integer
+from sqlalchemy.orm import Session
+from typing import List
 from pydantic import BaseModel
-from .function import read_file_and_extract_content
+from .database import (
+    SessionLocal, engine, Base, DATABASE_READ_ONLY, refresh_engine, check_indexes, current_snapshot_version, record_snapshot, changed_asns_since,
+    sqlite_path, relationship_snapshot,
+    DatasetASMappingTable, DelegatedStatsTable, CategorizedAsnTable, RelationshipAsnTable, RelatedAsnTable,
+    RovRatioTable, CountryAsnTable, CategoryFacetTable, CountryUpstreamTable, AsnDocumentTable,
+    SIBLING, PROVIDER, CUSTOMER, PEER, RELATED_KINDS, RELATED_FIELDS,
+)
+from .function import iter_file_content, iter_batches
+from .bulk import bulk_upsert, diff_upsert, SQLITE_MAX_VARIABLES
+from .cache import LRUCache
+from .metrics import MetricsMiddleware, record_ingest, cache_metrics, render as render_metrics, REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .rovista import RovistaFetcher, parse_ratio_history, parse_overview_asn
+from .analysis import compute_country_upstreams
+from .export import export_snapshot, iter_export_chunks, iter_stream_export, EXPORT_FORMATS, STREAM_FORMATS, ASN_UNIVERSE_SQL
+from .pipeline import iter_source_lines
+from .parsers import iter_delegated_stats_rows, iter_as_mapping_rows, iter_categorized_rows, parse_sibling_asns
+from .graph import AsGraph, iter_as_rel_edges, log_graph_loaded, PROVIDER_TO_CUSTOMER, PEER_TO_PEER, PROVIDERS, CUSTOMERS, CONE_MAX_NODES, parse_asn
 from typing import Optional
+from datetime import date
+from array import array
+import asyncio
+import json
 import logging
+import pandas as pd
 import os
-import requests
-import csv
-from datetime import datetime
+import threading
+import time
 
-# Créer le moteur de base de données SQLite
-SQLALCHEMY_DATABASE_URL = "sqlite:///./manrs_2023-08/newdatabase.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+# Fichier as-rel CAIDA pour le graphe en mémoire (à défaut: table relationship_asn)
+AS_REL_FILE_PATH = os.environ.get("MANRS_AS_REL_PATH", "")
+# Snapshot binaire du graphe, ouvert par mmap au démarrage (partagé entre workers)
+GRAPH_SNAPSHOT_PATH = os.environ.get("MANRS_GRAPH_PATH") or f"{sqlite_path() or 'manrs'}.graph"
 
-# Déclarer la base de données
-Base = declarative_base()
+# Graphe des relations AS chargé au démarrage
+relationship_graph: Optional[AsGraph] = None
 
-# Créer la session de base de données
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class AsnBatchRequest(BaseModel):
+    asns: List[str]
+    # Documents des frères développés: un lot de 10000 ASN pèse alors des centaines de Mo
+    details: bool = False
 
-# Modèle de données pour la table 'merged_df'
-    
-
-
-class DatasetASMappingTable(Base):
-    __tablename__ = "dataset_as_mapping"
-
-    id = Column(Integer, primary_key=True, index=True)
-    asn = Column(String, nullable=True)
-    status = Column(String, nullable=True)
-    reference_orgs = Column(String, nullable=True)  # Stocker une liste de références d'organisations au format JSON
-    sibling_asns = Column(String, nullable=True)     # Stocker une liste de frères ASN au format JSON
-    name = Column(String, nullable=True)
-    descr = Column(String, nullable=True)
-    website = Column(String, nullable=True)
-    comparison_with_ca2O = Column(String, nullable=True)
-    comparison_with_pdb = Column(String, nullable=True)
-    pdb_org_id = Column(String, nullable=True)
-    pdb_org = Column(String, nullable=True)
-    
-class DelegatedStatsTable(Base):
-    __tablename__ = "delegated_stats"
-
-    id = Column(Integer, primary_key=True, index=True)
-    registry = Column(String, nullable=True)
-    cc = Column(String, nullable=True)
-    type = Column(String, nullable=True)
-    start = Column(String, nullable=True)
-    value = Column(String, nullable=True)
-    date = Column(String, nullable=True)
-    status = Column(String, nullable=True)
-    opaque_id = Column(String, nullable=True)
-    extensions = Column(String, nullable=True)
-    
-class CategorizedAsnTable(Base):
-    __tablename__ = "categorized_asn"
-
-    id = Column(Integer, primary_key=True, index=True)
-    asn = Column(String, unique=True)
-    category_1 = Column(String, nullable=True)
-    category_2 = Column(String, nullable=True)
-
-class RelationshipAsnTable(Base):
-    __tablename__ = "relationship_asn"
-
-    id = Column(Integer, primary_key=True, index=True)
-    asn = Column(String, unique=True)
-    customers = Column(String, nullable=True)
-    providers = Column(String, nullable=True)
-
-    
-class DatasetASMapping(BaseModel):
-    asn: str
-    status: str
-    reference_orgs: str
-    sibling_asns: str
-    name: str
-    descr: str
-    website: str
-    comparison_with_ca2O: str
-    comparison_with_pdb: str
-    pdb_org_id: str
-    pdb_org: str
-    
-class DelegatedStatsRecord(BaseModel):
-    registry: str
-    cc: str
-    type: str
-    start: str
-    value: str
-    date: str
-    status: str
-    opaque_id: str
-    extensions: str
-    
-class CategorizedAsn(BaseModel):
-    asn: str
-    category_1: str
-    category_2: str
-
-class RelationshipAsn(BaseModel):
-    asn: str
-    customers: Optional[str]
-    providers: Optional[str]
 
+app = FastAPI()
+# Latence, statut et requêtes SQL par route, exposés sur /metrics
+app.add_middleware(MetricsMiddleware, routes=app.routes)
 
-# Créer toutes les tables dans la base de données
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+# Créer toutes les tables dans la base de données (impossible sur une base en lecture seule).
+# Au démarrage et non à l'import: build_database.py importe les loaders sans servir la base
+@app.on_event("startup")
+def create_tables():
+    if not DATABASE_READ_ONLY:
+        Base.metadata.create_all(bind=engine)
 
 # Configurer les logs
 logging.basicConfig(level=logging.INFO)
@@ -119,6 +64,9 @@ logger = logging.getLogger(__name__)
 
 # Fonction pour obtenir la session de la base de données
 def get_db():
+    # Un stat par requête suffit à détecter une base publiée entre-temps
+    if refresh_engine():
+        on_database_replaced()
     db = SessionLocal()
     try:
         return db
@@ -128,224 +76,628 @@ def get_db():
 
 
 #Function
-# Fonction pour obtenir le ratio le plus récent à partir du fichier CSV
-def get_latest_ratio_from_csv(asn):
-    latest_ratio = None
-    url = f"https://rovista.netsecurelab.org/data/asn/{asn}.csv"
-    response = requests.get(url)
-    
-    if response.status_code == 200:
-        file_path = f"csv_files/{asn}.csv"  # Chemin où enregistrer le fichier
-        with open(file_path, "wb") as file:
-            file.write(response.content)
-        try:
-            with open(file_path, "r", newline="") as file:
-                csv_reader = csv.DictReader(file)
-                for row in csv_reader:
-                    if "date" in row and "ratio" in row:
-                        ratio_date = datetime.strptime(row["date"], "%Y-%m-%d")
-                        ratio = float(row["ratio"])
-                        
-                        if latest_ratio is None or ratio_date > latest_ratio["date"]:
-                            latest_ratio = {"date": ratio_date, "ratio": ratio}
-        except Exception as e:
-            print(f"Error reading CSV file: {e}")
-        return latest_ratio
-    else:
-        print(f'error dowload: {response}')
-        
-    
-def find_asn_data(db: Session, asn):
-    dataset_mapping_data = db.query(DatasetASMappingTable).filter(DatasetASMappingTable.asn == str(asn)).first()
-    delegated_stats_data = db.query(DelegatedStatsTable).filter(DelegatedStatsTable.value == str(asn)).first()
-    categorized_asn_data = db.query(CategorizedAsnTable).filter(CategorizedAsnTable.asn == str(asn)).first()
-    relationship_asn_data = db.query(RelationshipAsnTable).filter(RelationshipAsnTable.asn == str(asn)).first()
-    print(dataset_mapping_data)
-    merged_data = {
-        "asn" : asn,
-        "sibling_asns" : dataset_mapping_data.sibling_asns if delegated_stats_data is not None and dataset_mapping_data.sibling_asns is not None else [],
-        "website" : dataset_mapping_data.website if delegated_stats_data is not None and dataset_mapping_data.website is not None else "",
-        "category_1" : categorized_asn_data.category_1 if categorized_asn_data.category_1 is not None else "",
-        "category_2" : categorized_asn_data.category_2 if categorized_asn_data.category_2 is not None else "",
-        "country_code": delegated_stats_data.cc if delegated_stats_data is not None and dataset_mapping_data.cc is not None else "",
-        "customers": relationship_asn_data.customers if relationship_asn_data is not None and relationship_asn_data.customers is not None else [],
-        "providers": relationship_asn_data.providers if relationship_asn_data is not None and relationship_asn_data.providers is not None else [],
-        "org_name": dataset_mapping_data.name if delegated_stats_data is not None and dataset_mapping_data.name is not None else "",
+# Taille des pages de /country/asns/
+COUNTRY_PAGE_SIZE = 100
+COUNTRY_PAGE_MAX_SIZE = 5000
+
+# CSV RoVista récupérés en parallèle par lots lors de l'ingestion
+ROVISTA_HISTORY_BATCH_SIZE = 500
+
+# Caches des documents ASN fusionnés et des réponses /asn/, par version de snapshot
+ASN_DOCUMENT_CACHE_SIZE = 50000
+ASN_RESPONSE_CACHE_SIZE = 5000
+# Réponses /asn/ gardées sérialisées: un ASN aux nombreux frères pèse des centaines de Ko
+ASN_RESPONSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+ASN_NOT_FOUND = False
+asn_document_cache = LRUCache("asn_documents", ASN_DOCUMENT_CACHE_SIZE)
+asn_response_cache = LRUCache("asn_responses", ASN_RESPONSE_CACHE_SIZE, ASN_RESPONSE_CACHE_MAX_BYTES)
+
+# Taille des listes IN (...) envoyées à SQLite
+ASN_BATCH_SIZE = min(10000, SQLITE_MAX_VARIABLES - 10)
+# Nombre maximal d'ASN par appel à /asn/batch/
+ASN_BATCH_MAX_SIZE = 10000
+# Au-delà, un lot ne passe pas par le cache LRU qu'il viderait des ASN consultés
+ASN_BATCH_CACHE_MAX_SIZE = 100
+# Lot d'ASN résolus par morceau des exports en flux: premier octet rapide
+STREAM_BATCH_SIZE = 500
+
+def canonical_asn(asn: str) -> str:
+    # "AS10105", " 10105" et "010105" désignent le même ASN: une seule clé pour
+    # les tables (en chaîne), le graphe et les caches
+    number = parse_asn(asn)
+    if number is None:
+        raise HTTPException(status_code=422, detail=f"invalid asn: {asn!r}")
+    return str(number)
+
+def empty_asn_data(asn):
+    return {
+        "asn": asn,
+        "sibling_asns": [],
+        "website": "",
+        "category_1": "",
+        "category_2": "",
+        "country_code": "",
+        "customers": [],
+        "providers": [],
+        "org_name": "",
+        "ratio_rov": None,
     }
-    return merged_data
 
-def extract_related_data(db: Session, related_asns):
-    related_data_list = []
-    for related_asn in related_asns:
-        related_data = find_asn_data(db, related_asn)
-        related_data_list.append(related_data)
-    return related_data_list
+def serving_snapshot(db: Session) -> int:
+    # Après une ingestion incrémentale, seuls les ASN journalisés quittent les caches;
+    # sinon le changement de version les vide entièrement
+    snapshot = current_snapshot_version(db)
+    for cache in (asn_document_cache, asn_response_cache):
+        if cache.version is not None and cache.version < snapshot:
+            asns = changed_asns_since(db, cache.version, snapshot)
+            if asns is not None:
+                cache.invalidate(asns, snapshot)
+    return snapshot
 
+def find_asn_data_batch(db: Session, asns, snapshot: Optional[int] = None, use_cache: bool = True, graph: Optional[AsGraph] = None):
+    # Nombre constant de requêtes par lot de ASN_BATCH_SIZE, quel que soit le nombre d'ASN
+    # Seuls les ASN présents dans au moins une table sont renvoyés
+    # use_cache=False pour les parcours complets, qui videraient le cache des ASN consultés
+    graph = graph or relationship_graph
+    if snapshot is None:
+        snapshot = serving_snapshot(db)
+    results = {}
+    asns_to_resolve = []
+    for asn in dict.fromkeys(str(asn) for asn in asns):
+        cached = asn_document_cache.get(asn, snapshot) if use_cache else None
+        if cached is None:
+            asns_to_resolve.append(asn)
+        elif cached is not ASN_NOT_FOUND:
+            results[asn] = dict(cached)
+    asns = asns_to_resolve
+    merged = {}
 
+    def document(asn):
+        if asn not in merged:
+            merged[asn] = empty_asn_data(asn)
+        return merged[asn]
 
-def create_or_update_delegated_stats(db: Session, delegated_data: DelegatedStatsRecord):
-    existing_entry = db.query(DelegatedStatsTable).filter_by(value=delegated_data.value).first()
-    if existing_entry:
-        for key, value in delegated_data.dict().items():
-            setattr(existing_entry, key, value)
-    else:
-        db_entry = DelegatedStatsTable(**delegated_data.dict())
-        db.add(db_entry)
-    db.commit()
-    
-def create_or_update_dataset_mapping(db: Session, dataset_data: DatasetASMapping):
-    existing_entry = db.query(DatasetASMappingTable).filter_by(asn=dataset_data.asn).first()
-    if existing_entry:
-        for key, value in dataset_data.dict().items():
-            setattr(existing_entry, key, value)
-    else:
-        db_entry = DatasetASMappingTable(**dataset_data.dict())
-        db.add(db_entry)
-    db.commit()
-    
-def create_or_update_categorized_asn(db: Session, data: CategorizedAsn):
-    existing_entry = db.query(CategorizedAsnTable).filter_by(asn=data.asn).first()
-    if existing_entry:
-        for key, value in data.dict().items():
-            setattr(existing_entry, key, value)
-    else:
-        db_entry = CategorizedAsnTable(**data.dict())
-        db.add(db_entry)
+    for chunk in iter_batches(asns, ASN_BATCH_SIZE):
+        for row in db.query(DatasetASMappingTable.asn, DatasetASMappingTable.website, DatasetASMappingTable.name).filter(
+            DatasetASMappingTable.asn.in_(chunk)
+        ):
+            data = document(row.asn)
+            data["website"] = row.website or ""
+            data["org_name"] = row.name or ""
+
+        # country_asn couvre aussi les ASN situés à l'intérieur d'un bloc délégué
+        numbers = {parse_asn(asn): asn for asn in chunk}
+        for row in db.query(CountryAsnTable.asn, CountryAsnTable.cc).filter(
+            CountryAsnTable.asn.in_([number for number in numbers if number is not None])
+        ):
+            data = document(numbers[row.asn])
+            data["country_code"] = data["country_code"] or row.cc or ""
+
+        for row in db.query(CategorizedAsnTable.asn, CategorizedAsnTable.category_1, CategorizedAsnTable.category_2).filter(
+            CategorizedAsnTable.asn.in_(chunk)
+        ):
+            data = document(row.asn)
+            data["category_1"] = row.category_1 or ""
+            data["category_2"] = row.category_2 or ""
+
+        for asn, ratio in find_latest_rov_ratios(db, chunk).items():
+            document(asn)["ratio_rov"] = ratio
+
+        kinds = [SIBLING] if graph is not None else [SIBLING, CUSTOMER, PROVIDER]
+        for row in db.query(RelatedAsnTable.asn, RelatedAsnTable.kind, RelatedAsnTable.related_asn).filter(
+            RelatedAsnTable.asn.in_(chunk), RelatedAsnTable.kind.in_(kinds)
+        ):
+            document(row.asn)[RELATED_FIELDS[row.kind]].append(row.related_asn)
+
+    if graph is not None:
+        for asn in asns:
+            customers = graph.customers(asn)
+            providers = graph.providers(asn)
+            if customers or providers:
+                data = document(asn)
+                data["customers"] = [str(related) for related in customers]
+                data["providers"] = [str(related) for related in providers]
+
+    # Graphe remplacé pendant la résolution: documents rendus mais pas mis en cache
+    use_cache = use_cache and graph is relationship_graph
+    # Les documents en cache ne sont jamais rendus tels quels: l'appelant peut les modifier
+    for asn in asns:
+        if use_cache:
+            asn_document_cache.put(asn, merged.get(asn, ASN_NOT_FOUND), snapshot)
+        if asn in merged:
+            results[asn] = dict(merged[asn])
+    return results
+
+def find_latest_rov_ratios(db: Session, asns):
+    # Dernière mesure de chaque ASN: parcours de l'index (asn, date, ratio)
+    latest = db.query(RovRatioTable.asn, func.max(RovRatioTable.date).label("date")).filter(
+        RovRatioTable.asn.in_([str(asn) for asn in asns])
+    ).group_by(RovRatioTable.asn).subquery()
+    rows = db.query(RovRatioTable.asn, RovRatioTable.date, RovRatioTable.ratio).join(
+        latest, (RovRatioTable.asn == latest.c.asn) & (RovRatioTable.date == latest.c.date)
+    )
+    return {row.asn: {"date": row.date, "ratio": row.ratio} for row in rows}
+
+def find_rov_trend(db: Session, asn, start: Optional[date] = None, end: Optional[date] = None):
+    query = db.query(RovRatioTable.date, RovRatioTable.ratio).filter(RovRatioTable.asn == str(asn))
+    if start is not None:
+        query = query.filter(RovRatioTable.date >= start.isoformat())
+    if end is not None:
+        query = query.filter(RovRatioTable.date <= end.isoformat())
+    return [{"date": row.date, "ratio": row.ratio} for row in query.order_by(RovRatioTable.date)]
+
+def find_asn_data(db: Session, asn):
+    return find_asn_data_batch(db, [asn]).get(str(asn)) or empty_asn_data(str(asn))
+
+def find_related_asns(db: Session, asn, kind: str):
+    rows = db.query(RelatedAsnTable.related_asn).filter(
+        RelatedAsnTable.asn == str(asn), RelatedAsnTable.kind == kind
+    )
+    return [row.related_asn for row in rows]
+
+def find_asns_listing(db: Session, asn, kind: str):
+    # Recherche inverse: qui déclare cet ASN comme frère / fournisseur / client / pair
+    rows = db.query(RelatedAsnTable.asn).filter(
+        RelatedAsnTable.related_asn == str(asn), RelatedAsnTable.kind == kind
+    )
+    return [row.asn for row in rows]
+
+def extract_related_data(db: Session, related_asns, snapshot: Optional[int] = None):
+    related_data = find_asn_data_batch(db, related_asns, snapshot)
+    return [related_data.get(str(asn)) or empty_asn_data(str(asn)) for asn in related_asns]
+
+def expand_siblings(db: Session, documents, snapshot: Optional[int] = None, use_cache: bool = True):
+    # Frères de tous les documents résolus en un seul passage, comme dans /asn/;
+    # ceux déjà dans le lot ne sont pas relus
+    siblings = {sibling for data in documents.values() for sibling in data["sibling_asns"]}
+    related = {asn: dict(documents[asn]) for asn in siblings if asn in documents}
+    related.update(find_asn_data_batch(db, siblings.difference(related), snapshot, use_cache))
+    for data in documents.values():
+        data["sibling_asns"] = [related.get(sibling) or empty_asn_data(sibling) for sibling in data["sibling_asns"]]
+    return documents
+
+
+# Ressources effectivement attribuées (les autres statuts: available, reserved)
+DELEGATED_STATUSES = ("assigned", "allocated")
+def delegated_stats_task(file_path: str, db: Session, incremental: bool = False):
+    return load_delegated_stats(db, iter_delegated_stats_rows(file_path), file_path, incremental)
+
+def load_delegated_stats(db: Session, rows, source: str, incremental: bool = False, derive: bool = True):
+    # derive=False: tables dérivées laissées à l'appelant (build en plusieurs sources)
+    changelog = [] if incremental else None
+    stats = write_table(db, DelegatedStatsTable.__table__, rows, ["registry", "type", "start"], changelog)
+    # Tables dérivées: inutile de les recalculer si aucun bloc ASN n'a changé
+    derive = derive and (changelog is None or bool(changelog))
+    if derive:
+        rebuild_country_asn_index(db)
+        rebuild_category_facets(db)
+    logger.info("Processed delegated stats from: %s (%d rows/s)", source, stats["rows_per_second"])
+    record_ingest("delegated_stats", stats)
+    stats["snapshot"] = record_snapshot(db, "delegated_stats", changelog)
+    if derive:
+        country_upstream_task(db)
+        refresh_asn_documents(db, changelog)
+    return stats
+
+# Pays inconnu: code utilisé par les RIR pour les ressources non attribuées
+UNKNOWN_COUNTRY = "ZZ"
+
+# Agrégation faite par SQLite en une passe: les ASN sans pays comptent sous ZZ
+CATEGORY_FACETS_SQL = f"""
+    INSERT INTO category_facet (cc, category_1, category_2, asn_count)
+    SELECT COALESCE(country_asn.cc, '{UNKNOWN_COUNTRY}'),
+           COALESCE(categorized_asn.category_1, ''),
+           COALESCE(categorized_asn.category_2, ''),
+           COUNT(*)
+    FROM categorized_asn
+    LEFT JOIN country_asn ON country_asn.asn = CAST(categorized_asn.asn AS INTEGER)
+    GROUP BY 1, 2, 3
+"""
+
+def rebuild_category_facets(db: Session):
+    db.query(CategoryFacetTable).delete(synchronize_session=False)
+    db.execute(CATEGORY_FACETS_SQL)
     db.commit()
+
+def iter_delegated_asns(rows):
+    # Un enregistrement type=asn couvre les ASN start .. start + value - 1
+    for cc, start, value in rows:
+        first, count = parse_asn(start), parse_asn(value)
+        if first is None or not cc or cc in ("ZZ", "*"):
+            continue
+        for asn in range(first, first + max(count or 1, 1)):
+            yield cc.upper(), asn
+
+def rebuild_country_asn_index(db: Session):
+    rows = db.query(DelegatedStatsTable.cc, DelegatedStatsTable.start, DelegatedStatsTable.value).filter(
+        DelegatedStatsTable.type == "asn", DelegatedStatsTable.status.in_(DELEGATED_STATUSES)
+    ).yield_per(10000)
+    entries = list(iter_delegated_asns(rows))
+    db.query(CountryAsnTable).delete(synchronize_session=False)
+    return bulk_upsert(db, CountryAsnTable.__table__, ({"cc": cc, "asn": asn} for cc, asn in entries), ["cc", "asn"])
     
-def create_or_update_relationship_asn(db: Session, data: RelationshipAsn):
-    existing_entry = db.query(RelationshipAsnTable).filter_by(asn=data.asn).first()
-    if existing_entry:
-        for key, value in data.dict().items():
-            setattr(existing_entry, key, value)
-    else:
-        db_entry = RelationshipAsnTable(**data.dict())
-        db.add(db_entry)
-    db.commit()
+def changed_row_asns(table_name: str, row):
+    # ASN dont le document fusionné dépend d'une ligne donnée
+    if table_name == DelegatedStatsTable.__tablename__:
+        first, count = parse_asn(row["start"]), parse_asn(row["value"])
+        if row["type"] == "asn" and first is not None:
+            yield from (str(asn) for asn in range(first, first + max(count or 1, 1)))
+        return
+    yield row["asn"]
+    if table_name == RelatedAsnTable.__tablename__:
+        yield row["related_asn"]
+
+def write_table(db: Session, table, rows, index_elements, changelog=None, scope=None):
+    # changelog None: rechargement complet; sinon seule la différence est écrite
+    # et les ASN touchés sont ajoutés au journal
+    if changelog is None:
+        return bulk_upsert(db, table, rows, index_elements)
+    stats, changes = diff_upsert(db, table, rows, index_elements, scope)
+    entries = {
+        (table.name, action, asn)
+        for action, old, new in changes
+        for row in (old, new) if row is not None
+        for asn in changed_row_asns(table.name, row)
+    }
+    changelog.extend(entries)
+    return stats
+
+def replace_related_asns(db: Session, kinds, edges, changelog=None):
+    # Remplace toutes les relations des types donnés, dans la transaction de l'upsert
+    rows = ({"asn": asn, "kind": kind, "related_asn": related} for asn, kind, related in edges)
+    if changelog is None:
+        db.query(RelatedAsnTable).filter(RelatedAsnTable.kind.in_(kinds)).delete(synchronize_session=False)
+    return write_table(
+        db, RelatedAsnTable.__table__, rows, ["asn", "kind", "related_asn"], changelog, RelatedAsnTable.kind.in_(kinds)
+    )
+
+def dataset_as_mapping_task(file_path: str, db: Session, incremental: bool = False):
+    return load_as_mapping(db, iter_as_mapping_rows(file_path), file_path, incremental)
+
+def iter_sibling_edges(db: Session):
+    # Paires relues depuis dataset_as_mapping une fois la table écrite, par
+    # lots: les millions de paires ne sont jamais toutes en mémoire
+    rows = db.query(DatasetASMappingTable.asn, DatasetASMappingTable.sibling_asns).yield_per(10000)
+    for asn, siblings in rows:
+        for sibling in parse_sibling_asns(siblings):
+            yield asn, SIBLING, sibling
+
+def load_as_mapping(db: Session, rows, source: str, incremental: bool = False, derive: bool = True):
+    changelog = [] if incremental else None
+    stats = write_table(db, DatasetASMappingTable.__table__, rows, ["asn"], changelog)
+    replace_related_asns(db, [SIBLING], iter_sibling_edges(db), changelog)
+    logger.info("Processed ASN organization info from: %s (%d rows/s)", source, stats["rows_per_second"])
+    record_ingest("dataset_as_mapping", stats)
+    stats["snapshot"] = record_snapshot(db, "dataset_as_mapping", changelog)
+    if derive:
+        refresh_asn_documents(db, changelog)
+    return stats
+
     
 
-def find_relationship_asn(db: Session, asn: str):
-    existing_entry = db.query(RelationshipAsnTable).filter_by(asn=asn).first()
-    if existing_entry:
-        return existing_entry
+def categorized_asn_task(file_path: str, db: Session, incremental: bool = False):
+    return load_categorized_asn(db, iter_categorized_rows(file_path), file_path, incremental)
+
+def load_categorized_asn(db: Session, rows, source: str, incremental: bool = False, derive: bool = True):
+    changelog = [] if incremental else None
+    stats = write_table(db, CategorizedAsnTable.__table__, rows, ["asn"], changelog)
+    if derive and (changelog is None or changelog):
+        rebuild_category_facets(db)
+    logger.info("Processed Categories Data info from: %s (%d rows/s)", source, stats["rows_per_second"])
+    record_ingest("categorized_asn", stats)
+    stats["snapshot"] = record_snapshot(db, "categorized_asn", changelog)
+    if derive:
+        refresh_asn_documents(db, changelog)
+    return stats
+
+def relationship_asn_task(file_path: str, db: Session, incremental: bool = False):
+    # file_path: fichier local (.bz2 lu à la volée) ou URL, téléchargée et
+    # décompressée dans un thread pendant l'analyse et l'écriture
+    return load_relationships(db, iter_source_lines(file_path), file_path, incremental)
+
+def load_relationships(db: Session, lines, source: str, incremental: bool = False):
+    return load_relationship_edges(db, iter_as_rel_edges(lines), source, incremental)
+
+def load_relationship_edges(db: Session, edges, source: str, incremental: bool = False, derive: bool = True):
+    # edges: triplets (source, destination, relation) entiers, au format CAIDA
+    changelog = [] if incremental else None
+    relations = {}
+    # Arêtes gardées pour le graphe en mémoire, sans relire la source
+    sources, destinations, kinds = array("I"), array("I"), array("b")
+
+    def related_edges():
+        for source_asn, destination_asn, relation in edges:
+            if relation not in (PEER_TO_PEER, PROVIDER_TO_CUSTOMER):
+                continue
+            sources.append(source_asn)
+            destinations.append(destination_asn)
+            kinds.append(relation)
+            source_asn, destination_asn = str(source_asn), str(destination_asn)
+            if relation == PEER_TO_PEER:
+                yield source_asn, PEER, destination_asn
+                yield destination_asn, PEER, source_asn
+                continue
+            provider, customer = source_asn, destination_asn
+            yield customer, PROVIDER, provider
+            yield provider, CUSTOMER, customer
+            relations.setdefault(provider, {"customers": [], "providers": []})["customers"].append(customer)
+            relations.setdefault(customer, {"customers": [], "providers": []})["providers"].append(provider)
+
+    # Les lignes sont analysées au fil de l'upsert de related_asn
+    replace_related_asns(db, [PROVIDER, CUSTOMER, PEER], related_edges(), changelog)
+    rows = (
+        {"asn": asn, "customers": str(data["customers"]), "providers": str(data["providers"])}
+        for asn, data in relations.items()
+    )
+    stats = write_table(db, RelationshipAsnTable.__table__, rows, ["asn"], changelog)
+    logger.info("Processed Peering and Provider info from: %s (%d rows/s)", source, stats["rows_per_second"])
+    record_ingest("relationship_asn", stats)
+
+    # Le graphe en mémoire suit la dernière source chargée
+    global relationship_graph
+    changed = derive and (changelog is None or bool(changelog))
+    if changed or (derive and relationship_graph is None):
+        started = time.perf_counter()
+        relationship_graph = AsGraph.from_edges(zip(sources, destinations, kinds))
+        log_graph_loaded(relationship_graph, source, started)
+    stats["snapshot"] = record_snapshot(db, "relationship_asn", changelog)
+    if changed:
+        country_upstream_task(db)
+        refresh_asn_documents(db, changelog)
+    return stats
+
+def rebuild_derived_tables(db: Session, graph: Optional[AsGraph] = None):
+    # Après un chargement avec derive=False
+    rebuild_country_asn_index(db)
+    rebuild_category_facets(db)
+    stats = country_upstream_task(db, graph)
+    update_asn_documents(db, graph=graph)
+    return stats
+
+def changelog_asns(changelog):
+    return None if changelog is None else {asn for _, _, asn in changelog}
+
+def refresh_asn_documents(db: Session, changelog):
+    # Incrémental: seuls les ASN journalisés sont réécrits; rechargement complet:
+    # tous. Pour recharger les quatre sources, reload_sources_task ne les
+    # reconstruit qu'une fois, après la dernière
+    return update_asn_documents(db, changelog_asns(changelog))
+
+def reload_sources_task(paths: dict, db: Session):
+    # paths: fichier (ou URL pour as_rel) par source, clés de build_database.SOURCES.
+    # Chargement sans tables dérivées, puis une seule reconstruction, comme build_database.py
+    global relationship_graph
+    load_delegated_stats(db, iter_delegated_stats_rows(paths["delegated"]), paths["delegated"], derive=False)
+    load_as_mapping(db, iter_as_mapping_rows(paths["as_org"]), paths["as_org"], derive=False)
+    load_categorized_asn(db, iter_categorized_rows(paths["categorized"]), paths["categorized"], derive=False)
+    edges = iter_as_rel_edges(iter_source_lines(paths["as_rel"]))
+    stats = load_relationship_edges(db, edges, paths["as_rel"], derive=False)
+    started = time.perf_counter()
+    relationship_graph = AsGraph.from_edges(iter_related_asn_edges(db), relationship_snapshot(db))
+    log_graph_loaded(relationship_graph, RelatedAsnTable.__tablename__, started)
+    rebuild_derived_tables(db, relationship_graph)
+    return stats
+
+def serialize_document(data) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode()
+
+def update_asn_documents(db: Session, asns=None, graph: Optional[AsGraph] = None):
+    # asns None: reconstruction complète; sinon seulement les ASN touchés.
+    # Les frères sont stockés en liste et développés à la lecture: un document
+    # par ASN, sans copie de ceux de ses frères
+    if asns is None:
+        db.query(AsnDocumentTable).delete(synchronize_session=False)
+        candidates = [str(row[0]) for row in db.execute(ASN_UNIVERSE_SQL)]
+    elif not asns or db.query(AsnDocumentTable.id).first() is None:
+        # Documents pas encore construits: une mise à jour partielle ne ferait
+        # que masquer leur absence
+        return None
     else:
-       return None
-   
-def update_relationship_asn(db: Session, existing_entry: RelationshipAsnTable, data: RelationshipAsn):
-    for key, value in data.dict().items():
-            setattr(existing_entry, key, value)
+        candidates = [asn for asn in asns if asn.isdigit() and parse_asn(asn) is not None]
+
+    snapshot = current_snapshot_version(db)
+    vanished = []
+
+    def rows():
+        # Lu pendant l'écriture: les documents ne sont jamais tous en mémoire
+        for chunk in iter_batches(candidates, ASN_BATCH_SIZE):
+            documents = find_asn_data_batch(db, chunk, snapshot, False, graph)
+            for asn in chunk:
+                if asn not in documents:
+                    vanished.append(int(asn))
+                    continue
+                data = documents[asn]
+                yield {
+                    "asn": int(asn),
+                    "snapshot": snapshot,
+                    "document": serialize_document({k: v for k, v in data.items() if k != "sibling_asns"}),
+                    "siblings": json.dumps(data["sibling_asns"]),
+                }
+
+    stats = bulk_upsert(db, AsnDocumentTable.__table__, rows(), ["asn"])
+    for chunk in iter_batches(vanished, ASN_BATCH_SIZE):
+        db.query(AsnDocumentTable).filter(AsnDocumentTable.asn.in_(chunk)).delete(synchronize_session=False)
     db.commit()
-    
-    
-    
-def delegated_stats_task(file_path: str, db: Session):
-    content = read_file_and_extract_content(file_path)
-    found_format_line = False
-    
-    for entry in content:
-        if entry.startswith("iana|ZZ|asn|0|1|20140311|reserved|ietf|iana"):
-            found_format_line = True
-            continue
-        
-        if found_format_line and entry:
-            entry = entry.strip().split('|')
-            data = DatasetASMapping(
-                registry = entry[0],
-                cc = entry[1],
-                type = entry[2],
-                start = entry[3],
-                value = entry[4],
-                date = entry[5],
-                status = entry[6],
-                opaque_id = entry[7],
-                extensions = entry[8]
-            )      
-            create_or_update_delegated_stats(db, data)
-    
-    logger.info("Processed ASN organization info from file: %s", file_path)
-    
-def dataset_as_mapping_task(file_path: str, db: Session):
-    content = read_file_and_extract_content(file_path)
-
-    for asn, data in content.items():
-        reference_orgs =  data.get("Reference Orgs", [])
-        
-        sibling_asns = data.get("Sibling ASNs", [])
-        print(sibling_asns
-              )
-        dataset_mapping = DatasetASMapping(
-            asn=asn,
-            status=data.get("Status", ""),
-            reference_orgs=str(reference_orgs),
-            sibling_asns=str(sibling_asns),
-            name=data.get("Name", ""),
-            descr=data.get("Descr", ""),
-            website=data.get("Website", ""),
-            comparison_with_ca2O=data.get("Comparison with CA2O", ""),
-            comparison_with_pdb=data.get("Comparison with PDB", ""),
-            pdb_org_id=data.get("PDB.org_id", ""),
-            pdb_org=data.get("PDB.org", "")
-        )
-        
-        create_or_update_dataset_mapping(db, dataset_mapping)  # Utiliser la fonction pour enregistrer ou mettre à jour
-    logger.info("Processed ASN organization info from file: %s", file_path)   
-    return {"message": "Processing started in background"}
+    logger.info("Serialized %d ASN documents (%d rows/s)", stats["rows"], stats["rows_per_second"])
+    record_ingest("asn_document", stats)
+    return stats
 
-    
+def with_siblings(document: bytes, siblings: bytes) -> bytes:
+    # Ajoute sibling_asns à un objet JSON sérialisé, sans le décoder
+    return document[:-1] + b',"sibling_asns":' + siblings + b"}"
 
-def categorized_asn_task(file_path: str, db: Session):
-    content = read_file_and_extract_content(file_path)
+def read_asn_documents(db: Session, asns):
+    # Documents stockés des ASN donnés, leurs frères restant en liste d'ASN
+    numbers = {parse_asn(asn): asn for asn in asns if asn.isdigit()}
+    numbers.pop(None, None)
+    documents = {}
+    for chunk in iter_batches(list(numbers), ASN_BATCH_SIZE):
+        for row in db.query(AsnDocumentTable.asn, AsnDocumentTable.document, AsnDocumentTable.siblings).filter(
+            AsnDocumentTable.asn.in_(chunk)
+        ):
+            documents[numbers[row.asn]] = (row.document, row.siblings.encode())
+    return documents
 
-    for entry in content:
-            data = CategorizedAsn(
-                asn = entry['ASN'].replace('AS',''),
-                category_1 = entry['Category 1 - Layer 1'],
-                category_2 = entry['Category 1 - Layer 2'],
-            )
-            create_or_update_categorized_asn(db, data)
+def country_upstream_task(db: Session, graph: Optional[AsGraph] = None):
+    # Analyse dérivée du graphe et de country_asn: recalculée quand l'un des deux change
+    graph = graph or relationship_graph
+    if graph is None:
+        logger.warning("Relationship graph not loaded: upstream dependencies not computed")
+        return None
+    countries = pd.DataFrame.from_records(
+        db.query(CountryAsnTable.asn, CountryAsnTable.cc).all(), columns=["asn", "cc"]
+    )
+    result = compute_country_upstreams(graph, countries)
 
-    logger.info("Processed Categories Data info from file: %s", file_path)
+    snapshot = current_snapshot_version(db)
+    db.query(CountryUpstreamTable).delete(synchronize_session=False)
+    rows = (dict(row, snapshot=snapshot) for row in result.to_dict("records"))
+    stats = bulk_upsert(db, CountryUpstreamTable.__table__, rows, ["snapshot", "cc", "provider_asn"])
+    record_ingest("country_upstream", stats)
+    stats["snapshot"] = snapshot
+    return stats
 
-def relationship_asn_task(file_path: str, db: Session):
-    content = read_file_and_extract_content(file_path)
-    
-    for entry in content:
-        if entry.startswith("# step 1: set peering in clique"):
-            continue
-        if entry.startswith("# step 2: initial provider assignment"):
-            continue
-        entry = entry.strip().split('|')
-        if len(entry) == 1:
-            # Traitement pour une seule colonne
+
+def rovista_overview_task(file_path: str, db: Session, snapshot_date: Optional[date] = None):
+    # overview.json ne porte pas de date: la mesure est datée du jour de l'ingestion
+    measured_on = (snapshot_date or date.today()).isoformat()
+    # Seuls les documents des ASN mesurés changent
+    asns = set()
+
+    def rows():
+        for entry in iter_file_content(file_path):
+            asn = parse_overview_asn(entry.get("asn", ""))
+            if not asn or entry.get("ratio") in (None, ""):
+                continue
+            try:
+                ratio = float(entry["ratio"])
+            except (TypeError, ValueError):
+                continue
+            asns.add(asn)
+            yield {"asn": asn, "date": measured_on, "ratio": ratio}
+
+    stats = bulk_upsert(db, RovRatioTable.__table__, rows(), ["asn", "date"])
+    logger.info("Processed RoVista overview from file: %s (%d rows/s)", file_path, stats["rows_per_second"])
+    record_ingest("rovista_overview", stats)
+    stats["snapshot"] = record_snapshot(db, "rov_ratio")
+    update_asn_documents(db, asns)
+    return stats
+
+def rovista_history_task(db: Session, asns=None, fetcher: Optional[RovistaFetcher] = None):
+    # Historique complet des CSV par ASN; par défaut les ASN déjà connus de rov_ratio
+    if asns is None:
+        asns = [row.asn for row in db.query(RovRatioTable.asn).distinct()]
+    fetcher = fetcher or RovistaFetcher()
+    loop = asyncio.new_event_loop()
+
+    def rows():
+        for batch in iter_batches(asns, ROVISTA_HISTORY_BATCH_SIZE):
+            contents = loop.run_until_complete(fetcher.fetch_csvs(batch))
+            for asn, content in contents.items():
+                for ratio_date, ratio in parse_ratio_history(content or ""):
+                    yield {"asn": asn, "date": ratio_date.isoformat(), "ratio": ratio}
+
+    try:
+        stats = bulk_upsert(db, RovRatioTable.__table__, rows(), ["asn", "date"])
+    finally:
+        loop.run_until_complete(fetcher.aclose())
+        loop.close()
+    logger.info("Processed RoVista history for %d ASNs (%d rows/s)", len(asns), stats["rows_per_second"])
+    record_ingest("rovista_history", stats)
+    stats["snapshot"] = record_snapshot(db, "rov_ratio")
+    update_asn_documents(db, {str(asn) for asn in asns})
+    return stats
+
+
+def load_relationship_graph(db: Session):
+    started = time.perf_counter()
+    if AS_REL_FILE_PATH and os.path.exists(AS_REL_FILE_PATH):
+        graph = AsGraph.from_as_rel_file(AS_REL_FILE_PATH)
+        log_graph_loaded(graph, AS_REL_FILE_PATH, started)
+        return graph
+
+    version = relationship_snapshot(db)
+    graph = load_graph_snapshot(GRAPH_SNAPSHOT_PATH, version)
+    if graph is not None:
+        log_graph_loaded(graph, GRAPH_SNAPSHOT_PATH, started)
+        return graph
+
+    graph = AsGraph.from_edges(iter_related_asn_edges(db), version)
+    log_graph_loaded(graph, RelatedAsnTable.__tablename__, started)
+    if not DATABASE_READ_ONLY:
+        # Le prochain worker démarre sur le snapshot
+        try:
+            graph.save(GRAPH_SNAPSHOT_PATH)
+        except OSError as e:
+            logger.warning("Could not write graph snapshot %s: %s", GRAPH_SNAPSHOT_PATH, e)
+    return graph
+
+
+def load_graph_snapshot(path: str, version: str) -> Optional[AsGraph]:
+    # Un snapshot d'une autre version des relations est ignoré
+    if not os.path.exists(path):
+        return None
+    try:
+        graph = AsGraph.load(path)
+    except (ValueError, OSError) as e:
+        logger.warning("Ignoring graph snapshot %s: %s", path, e)
+        return None
+    if graph.version != version:
+        logger.info("Graph snapshot %s is stale (%s, database at %s)", path, graph.version, version)
+        return None
+    return graph
+
+
+def iter_related_asn_edges(db: Session):
+    rows = db.query(RelatedAsnTable.asn, RelatedAsnTable.kind, RelatedAsnTable.related_asn).filter(
+        RelatedAsnTable.kind.in_([PROVIDER, PEER])
+    ).yield_per(10000)
+    for asn, kind, related in rows:
+        asn, related = parse_asn(asn), parse_asn(related)
+        if asn is None or related is None:
             continue
-        if entry and entry[2]and entry[2]=='0':
-            
-            data = RelationshipAsn(
-                asn = entry[0],
-                provider = "",
-                customer =  entry[1],
-            )
-            create_or_update_relationship_asn(db, data)
-            
-        if entry and entry[2]=='-1':
-            check_data = find_relationship_asn(db, entry[0])
-            if check_data is None:
-                data = RelationshipAsn(
-                    asn = entry[0],
-                    provider = entry[1],
-                    customer =  "",
-                )
-                create_or_update_relationship_asn(db, data)
-            else:
-                data = RelationshipAsn(
-                    asn = entry[0],
-                    provider = entry[1],
-                    customer =  check_data.customer,
-                )
-                update_relationship_asn(db, check_data, data)
-            
-
-    logger.info("Processed Peering and Provider info from file: %s ", file_path)
+        if kind == PROVIDER:
+            yield related, asn, PROVIDER_TO_CUSTOMER
+        elif asn < related:
+            # Les pairs sont stockés dans les deux sens
+            yield asn, related, PEER_TO_PEER
+
+
+def clear_asn_caches():
+    for cache in (asn_document_cache, asn_response_cache):
+        cache.clear()
+
+def reload_relationship_graph():
+    global relationship_graph
+    db = SessionLocal()
+    try:
+        relationship_graph = load_relationship_graph(db)
+    finally:
+        db.close()
+    # Documents construits avec l'ancien graphe pendant le rechargement: ils
+    # portent déjà la version de la nouvelle base, seul un vidage les évince
+    clear_asn_caches()
+
+def on_database_replaced():
+    # Les versions de snapshot de la nouvelle base ne prolongent pas celles de l'ancienne
+    clear_asn_caches()
+    # L'ancien graphe reste servi pendant la reconstruction; les caches sont
+    # vidés une seconde fois une fois le nouveau graphe installé
+    threading.Thread(target=reload_relationship_graph, name="graph-reload", daemon=True).start()
+
+
+@app.on_event("startup")
+def startup_load_relationship_graph():
+    global relationship_graph
+    check_indexes(engine)
+    db = SessionLocal()
+    try:
+        if db.query(RelatedAsnTable.id).first() is None and db.query(RelationshipAsnTable.id).first() is not None:
+            logger.warning("related_asn is empty but relationship_asn is not: run `alembic upgrade head`")
+        relationship_graph = load_relationship_graph(db)
+    finally:
+        db.close()
+
 
 
 
@@ -361,58 +713,388 @@ async def get_info_asn(
 ):
     if not asn:
         raise HTTPException(status_code=400, detail="asn is required")
-    
+    asn = canonical_asn(asn)
+
+    snapshot = serving_snapshot(db)
+    content = asn_response_cache.get(asn, snapshot)
+    if content is not None:
+        # Octets déjà encodés: ni jsonable_encoder ni json.dumps sur un succès
+        return Response(content=content, media_type="application/json")
+    graph = relationship_graph
+
     results = []
     total_results = 0
     
     if asn:
-        asn_data = find_asn_data(db, asn)
-         # Extract customer and provider details
-        if asn_data["sibling_asns"] is not []:  
-            asn_data["sibling_asns"] = extract_related_data(db, asn_data["sibling_asns"])
+        asn_data = find_asn_data_batch(db, [asn], snapshot).get(asn)
+        if asn_data is None:
+            raise HTTPException(status_code=404, detail="asn not found")
+        siblings = list(asn_data["sibling_asns"])
+        # Détails des frères en un seul lot
+        if asn_data["sibling_asns"]:
+            asn_data["sibling_asns"] = extract_related_data(db, asn_data["sibling_asns"], snapshot)
 
         results = asn_data
         total_results = 1
     
-    return {"total_results": total_results, "results": results}
+    content = serialize_document({"total_results": total_results, "results": results})
+    # La réponse embarque les documents des frères: elle est évincée avec eux
+    if graph is relationship_graph:
+        asn_response_cache.put(asn, content, snapshot, depends_on=siblings)
+    return Response(content=content, media_type="application/json")
 
 
-"""@app.get("/asn/")
-async def get_asn_by_country_or_category(
-    country: str = Query(None),
+@app.get("/asn/document/")
+async def get_asn_document(
     asn: str = Query(None),
-    skip: int = Query(0),
-    limit: int = Query(10),
     db: SessionLocal = Depends(get_db)
 ):
-    if not any([country, category_1, category_2, asn]):
-        raise HTTPException(status_code=400, detail="Au moins un paramètre de requête est requis.")
-    
+    # Documents sérialisés à l'ingestion: l'ASN puis ses frères, deux lectures
+    # indexées et une concaténation d'octets, sans décodage des documents
+    if not asn:
+        raise HTTPException(status_code=400, detail="asn is required")
+    asn = canonical_asn(asn)
+    stored = read_asn_documents(db, [asn]).get(asn)
+    if stored is None:
+        if db.query(AsnDocumentTable.id).first() is None:
+            raise HTTPException(status_code=503, detail="ASN documents not built")
+        raise HTTPException(status_code=404, detail="asn not found")
+
+    document, siblings = stored
+    siblings = json.loads(siblings)
+    related = read_asn_documents(db, siblings)
+    embedded = [
+        with_siblings(*related[sibling]) if sibling in related else serialize_document(empty_asn_data(sibling))
+        for sibling in siblings
+    ]
+    content = with_siblings(document, b"[" + b",".join(embedded) + b"]")
+    return Response(content=b'{"total_results":1,"results":' + content + b"}", media_type="application/json")
+
+
+@app.post("/asn/batch/")
+def post_asn_batch(
+    request: AsnBatchRequest,
+    db: SessionLocal = Depends(get_db)
+):
+    # Route synchrone: la résolution d'un grand lot occupe un thread, pas la boucle
+    if not request.asns:
+        raise HTTPException(status_code=400, detail="asns is required")
+    if len(request.asns) > ASN_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"at most {ASN_BATCH_MAX_SIZE} asns per request")
+
+    # Forme canonique, None pour une entrée illisible: elle est signalée sans faire échouer le lot
+    numbers = [parse_asn(asn) for asn in request.asns]
+    asns = [str(number) for number in numbers if number is not None]
+
+    snapshot = serving_snapshot(db)
+    use_cache = len(asns) <= ASN_BATCH_CACHE_MAX_SIZE
+    documents = find_asn_data_batch(db, asns, snapshot, use_cache)
+
+    if request.details:
+        expand_siblings(db, documents, snapshot, use_cache)
+
+    # Ordre de la requête, doublons compris; un ASN inconnu ou invalide n'interrompt pas le lot
     results = []
-    total_results = 0
-    
-    if asn:
-        asn_data = find_asn_data(db, asn)
-         # Extract customer and provider details
-        customer_data_list = extract_related_data(db, asn_data["customers"])
-        provider_data_list = extract_related_data(db, asn_data["providers"])
-        
-        # Add customer details for providers
-        for provider_data in provider_data_list:
-            provider_asn = provider_data["asn"]
-            provider_data["level_1_providers"] = extract_related_data(db, provider_data["providers"])
-            provider_data["level_1_customers"] = extract_related_data(db, provider_data["customers"])
-            
-            # Add customer details for level 1 providers
-            for level_1_provider_data in provider_data["level_1_providers"]:
-                level_1_provider_asn = level_1_provider_data["asn"]
-                level_1_provider_data["providers"] = extract_related_data(db, level_1_provider_data["providers"])
-                level_1_provider_data["customers"] = extract_related_data(db, level_1_provider_data["customers"])
-            
-        asn_data["customers_details"] = customer_data_list
-        asn_data["providers_details"] = provider_data_list
+    for requested, number in zip(request.asns, numbers):
+        if number is None:
+            results.append({"asn": requested, "not_found": True, "invalid": True})
+        else:
+            results.append(documents.get(str(number)) or {"asn": str(number), "not_found": True})
+    not_found = sum(1 for result in results if result.get("not_found"))
+    # Documents déjà sérialisables: jsonable_encoder coûterait plus que la résolution
+    return JSONResponse({"total_results": len(results) - not_found, "not_found": not_found, "results": results})
 
-        results = asn_data
-        total_results = 1
-    
-    return {"total_results": total_results, "results": results}"""
+
+@app.get("/asn/relationships/")
+async def get_asn_relationships(asn: str = Query(None)):
+    if not asn:
+        raise HTTPException(status_code=400, detail="asn is required")
+    asn = canonical_asn(asn)
+    if relationship_graph is None:
+        raise HTTPException(status_code=503, detail="Relationship graph not loaded")
+    if asn not in relationship_graph:
+        raise HTTPException(status_code=404, detail="asn not found")
+
+    return {
+        "asn": asn,
+        "providers": relationship_graph.providers(asn),
+        "customers": relationship_graph.customers(asn),
+        "peers": relationship_graph.peers(asn),
+    }
+
+
+@app.get("/asn/supply-chain/")
+async def get_asn_supply_chain(
+    asn: str = Query(None),
+    direction: str = Query("upstream"),
+    depth: Optional[int] = Query(None, ge=1),
+    max_nodes: int = Query(CONE_MAX_NODES, ge=1, le=CONE_MAX_NODES),
+):
+    if not asn:
+        raise HTTPException(status_code=400, detail="asn is required")
+    asn = canonical_asn(asn)
+    if direction not in ("upstream", "downstream", "both"):
+        raise HTTPException(status_code=400, detail="direction must be upstream, downstream or both")
+    if relationship_graph is None:
+        raise HTTPException(status_code=503, detail="Relationship graph not loaded")
+    if asn not in relationship_graph:
+        raise HTTPException(status_code=404, detail="asn not found")
+
+    # Cône amont = fournisseurs transitifs, cône aval = clients transitifs
+    response = {"asn": asn}
+    if direction in ("upstream", "both"):
+        response["upstream"] = relationship_graph.cone(asn, PROVIDERS, depth, max_nodes)
+    if direction in ("downstream", "both"):
+        response["downstream"] = relationship_graph.cone(asn, CUSTOMERS, depth, max_nodes)
+    return response
+
+
+@app.get("/asn/related/")
+async def get_related_asns(
+    asn: str = Query(None),
+    kind: str = Query(SIBLING),
+    reverse: bool = Query(False),
+    db: SessionLocal = Depends(get_db)
+):
+    if not asn:
+        raise HTTPException(status_code=400, detail="asn is required")
+    if kind not in RELATED_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(RELATED_KINDS)}")
+    asn = canonical_asn(asn)
+
+    # reverse=true: les ASN qui déclarent `asn` comme relation de ce type
+    results = find_asns_listing(db, asn, kind) if reverse else find_related_asns(db, asn, kind)
+    return {"asn": asn, "kind": kind, "reverse": reverse, "total_results": len(results), "results": results}
+
+
+@app.get("/asn/rov/")
+async def get_asn_rov_ratio(
+    asn: List[str] = Query(None),
+    db: SessionLocal = Depends(get_db)
+):
+    if not asn:
+        raise HTTPException(status_code=400, detail="asn is required")
+
+    # Plusieurs ASN (?asn=1&asn=2): dernier ratio de chacun, lu dans rov_ratio
+    asn = [canonical_asn(value) for value in asn]
+    ratios = find_latest_rov_ratios(db, asn)
+    results = [{"asn": key, "ratio_rov": ratios.get(key)} for key in dict.fromkeys(asn)]
+    return {"total_results": len(results), "results": results}
+
+
+@app.get("/asn/rov/trend/")
+async def get_asn_rov_trend(
+    asn: str = Query(None),
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    db: SessionLocal = Depends(get_db)
+):
+    if not asn:
+        raise HTTPException(status_code=400, detail="asn is required")
+    asn = canonical_asn(asn)
+
+    results = find_rov_trend(db, asn, start, end)
+    return {"asn": asn, "total_results": len(results), "results": results}
+
+
+def current_caches():
+    caches = [asn_document_cache, asn_response_cache]
+    if relationship_graph is not None:
+        caches.append(relationship_graph.cone_cache)
+    return caches
+
+# Taux de succès lus sur les caches au moment de la collecte
+REGISTRY.register_collector(lambda: cache_metrics(current_caches()))
+
+
+@app.get("/cache/stats/")
+async def get_cache_stats():
+    return {"results": [cache.stats() for cache in current_caches()]}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    # Compteurs de ce processus: avec plusieurs workers, chacun expose les siens
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+def country_asns_query(db: Session, cc: str):
+    return db.query(CountryAsnTable.asn).filter(CountryAsnTable.cc == cc.upper()).order_by(CountryAsnTable.asn)
+
+
+def category_asns_query(db: Session, category_1: Optional[str], category_2: Optional[str], cc: Optional[str]):
+    query = db.query(CategorizedAsnTable.asn)
+    if category_1:
+        query = query.filter(CategorizedAsnTable.category_1 == category_1)
+    if category_2:
+        query = query.filter(CategorizedAsnTable.category_2 == category_2)
+    if cc:
+        query = query.join(
+            CountryAsnTable, CountryAsnTable.asn == cast(CategorizedAsnTable.asn, Integer)
+        ).filter(CountryAsnTable.cc == cc.upper())
+    return query.order_by(CategorizedAsnTable.asn)
+
+
+def iter_asn_documents(db: Session, query):
+    # Curseur SQLite parcouru au fil de l'envoi: mémoire bornée par STREAM_BATCH_SIZE
+    snapshot = serving_snapshot(db)
+    rows = query.yield_per(STREAM_BATCH_SIZE)
+    for chunk in iter_batches((str(row.asn) for row in rows), STREAM_BATCH_SIZE):
+        documents = find_asn_data_batch(db, chunk, snapshot, use_cache=False)
+        yield [documents.get(asn) or empty_asn_data(asn) for asn in chunk]
+
+
+def stream_asn_documents(db: Session, query, fmt: str, filename: str):
+    if fmt not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(STREAM_FORMATS)}")
+    # Générateur synchrone: Starlette le parcourt dans un thread, hors de la boucle
+    return StreamingResponse(
+        iter_stream_export(iter_asn_documents(db, query), fmt),
+        media_type=STREAM_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
+
+
+@app.get("/country/asns/")
+def get_country_asns(
+    cc: str = Query(None),
+    cursor: Optional[int] = Query(None, ge=0),
+    limit: int = Query(COUNTRY_PAGE_SIZE, ge=1, le=COUNTRY_PAGE_MAX_SIZE),
+    details: bool = Query(False),
+    db: SessionLocal = Depends(get_db)
+):
+    # Route synchrone: avec details, la résolution de la page occupe un thread, pas la boucle
+    if not cc or len(cc) != 2:
+        raise HTTPException(status_code=400, detail="cc is required (ISO 3166 alpha-2)")
+
+    # Pagination par clé: cursor = dernier ASN de la page précédente
+    query = country_asns_query(db, cc)
+    if cursor is not None:
+        query = query.filter(CountryAsnTable.asn > cursor)
+    asns = [row.asn for row in query.limit(limit)]
+
+    results = asns
+    if details:
+        documents = find_asn_data_batch(db, asns)
+        results = [documents.get(str(asn)) or empty_asn_data(str(asn)) for asn in asns]
+    next_cursor = asns[-1] if len(asns) == limit else None
+    return {"cc": cc.upper(), "total_results": len(results), "next_cursor": next_cursor, "results": results}
+
+
+@app.get("/category/facets/")
+async def get_category_facets(
+    cc: str = Query(None),
+    db: SessionLocal = Depends(get_db)
+):
+    # Un pays: lecture directe de l'index; sinon somme sur tous les pays
+    if cc:
+        query = db.query(
+            CategoryFacetTable.category_1, CategoryFacetTable.category_2, CategoryFacetTable.asn_count
+        ).filter(CategoryFacetTable.cc == cc.upper())
+    else:
+        query = db.query(
+            CategoryFacetTable.category_1,
+            CategoryFacetTable.category_2,
+            func.sum(CategoryFacetTable.asn_count).label("asn_count"),
+        ).group_by(CategoryFacetTable.category_1, CategoryFacetTable.category_2)
+
+    results = [
+        {"category_1": row.category_1, "category_2": row.category_2, "asn_count": row.asn_count}
+        for row in query.order_by(CategoryFacetTable.category_1, CategoryFacetTable.category_2)
+    ]
+    return {"cc": cc.upper() if cc else None, "total_results": len(results), "results": results}
+
+@app.get("/category/asns/")
+def get_category_asns(
+    category_1: str = Query(None),
+    category_2: str = Query(None),
+    cc: str = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(COUNTRY_PAGE_SIZE, ge=1, le=COUNTRY_PAGE_MAX_SIZE),
+    details: bool = Query(False),
+    db: SessionLocal = Depends(get_db)
+):
+    # Route synchrone: avec details, la résolution de la page occupe un thread, pas la boucle
+    if not category_1 and not category_2:
+        raise HTTPException(status_code=400, detail="category_1 or category_2 is required")
+
+    query = category_asns_query(db, category_1, category_2, cc)
+    # Pagination par clé sur l'ASN (chaîne, dans l'ordre de l'index)
+    if cursor is not None:
+        query = query.filter(CategorizedAsnTable.asn > cursor)
+    asns = [row.asn for row in query.limit(limit)]
+
+    results = asns
+    if details:
+        documents = find_asn_data_batch(db, asns)
+        results = [documents.get(asn) or empty_asn_data(asn) for asn in asns]
+    next_cursor = asns[-1] if len(asns) == limit else None
+    return {"total_results": len(results), "next_cursor": next_cursor, "results": results}
+
+
+@app.get("/country/asns/export/")
+def get_country_asns_export(
+    cc: str = Query(None),
+    format: str = Query("ndjson"),
+    db: SessionLocal = Depends(get_db)
+):
+    if not cc or len(cc) != 2:
+        raise HTTPException(status_code=400, detail="cc is required (ISO 3166 alpha-2)")
+    return stream_asn_documents(db, country_asns_query(db, cc), format, f"country-{cc.upper()}")
+
+
+@app.get("/category/asns/export/")
+def get_category_asns_export(
+    category_1: str = Query(None),
+    category_2: str = Query(None),
+    cc: str = Query(None),
+    format: str = Query("ndjson"),
+    db: SessionLocal = Depends(get_db)
+):
+    if not category_1 and not category_2:
+        raise HTTPException(status_code=400, detail="category_1 or category_2 is required")
+    query = category_asns_query(db, category_1, category_2, cc)
+    return stream_asn_documents(db, query, format, "category")
+
+
+@app.get("/country/upstreams/")
+async def get_country_upstreams(
+    cc: str = Query(None),
+    limit: int = Query(COUNTRY_PAGE_SIZE, ge=1, le=COUNTRY_PAGE_MAX_SIZE),
+    db: SessionLocal = Depends(get_db)
+):
+    if not cc or len(cc) != 2:
+        raise HTTPException(status_code=400, detail="cc is required (ISO 3166 alpha-2)")
+    snapshot = db.query(func.max(CountryUpstreamTable.snapshot)).scalar()
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="Upstream dependencies not computed")
+
+    rows = db.query(CountryUpstreamTable).filter(
+        CountryUpstreamTable.snapshot == snapshot, CountryUpstreamTable.cc == cc.upper()
+    ).order_by(CountryUpstreamTable.dependent_asns.desc(), CountryUpstreamTable.provider_asn).limit(limit)
+    results = [
+        {
+            "provider_asn": row.provider_asn,
+            "provider_cc": row.provider_cc,
+            "dependent_asns": row.dependent_asns,
+            "share": row.share,
+        }
+        for row in rows
+    ]
+    return {"cc": cc.upper(), "snapshot": snapshot, "total_results": len(results), "results": results}
+
+
+@app.get("/export/asns/")
+def get_export_asns(
+    format: str = Query("parquet"),
+    db: SessionLocal = Depends(get_db)
+):
+    # Route synchrone: la première construction du fichier bloque un thread, pas la boucle
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    path = export_snapshot(db, format, relationship_graph)
+    headers = {
+        "Content-Disposition": f'attachment; filename="{os.path.basename(path)}"',
+        "Content-Length": str(os.path.getsize(path)),
+    }
+    return StreamingResponse(iter_export_chunks(path), media_type=EXPORT_FORMATS[format][1], headers=headers)
@@ -0,0 +1,273 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Format texte d'exposition Prometheus (Starlette ajoute charset=utf-8)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Bornes des histogrammes, en secondes pour les latences
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250, 1000)
+
+# Requêtes hors des routes déclarées (404...): une seule série, pas une par chemin
+UNMATCHED_ROUTE = "other"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Série de valeurs par combinaison de labels, protégée par un verrou.
+
+    Les mises à jour sont de simples opérations sur un dict: pas de dépendance
+    à prometheus_client, le texte est produit à la lecture de /metrics.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], Sequence, float]]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, self.labels, key, value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, values, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        # Comptes par tranche, cumulés seulement au rendu
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        bucket_labels = self.labels + ("le",)
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", bucket_labels, key + (_format_value(bound),), cumulative
+            yield f"{self.name}_sum", self.labels, key, total
+            yield f"{self.name}_count", self.labels, key, count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        # Métriques construites à la lecture, à partir d'un état existant (caches)
+        self.collectors: List[Callable[[], Iterable[Metric]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Metric]]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for metric in collector():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "manrs_http_requests_total", "HTTP requests by route and status.", ("method", "route", "status")
+))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "manrs_http_request_duration_seconds", "HTTP request latency, until the last byte of the body.", ("method", "route")
+))
+HTTP_DB_QUERIES = REGISTRY.register(Histogram(
+    "manrs_http_request_db_queries", "SQL statements executed per HTTP request.", ("method", "route"), QUERY_COUNT_BUCKETS
+))
+ROVISTA_LATENCY = REGISTRY.register(Histogram(
+    "manrs_rovista_fetch_duration_seconds", "RoVista CSV fetch latency by HTTP status (error: no response).", ("status",)
+))
+ROVISTA_ERRORS = REGISTRY.register(Counter(
+    "manrs_rovista_fetch_errors_total", "RoVista CSV fetches that failed, by reason.", ("reason",)
+))
+INGEST_RUNS = REGISTRY.register(Counter("manrs_ingest_runs_total", "Ingest task runs.", ("task",)))
+INGEST_ROWS = REGISTRY.register(Counter("manrs_ingest_rows_total", "Rows written or compared by ingest tasks.", ("task",)))
+INGEST_SECONDS = REGISTRY.register(Counter("manrs_ingest_seconds_total", "Time spent writing ingested rows.", ("task",)))
+INGEST_THROUGHPUT = REGISTRY.register(Gauge(
+    "manrs_ingest_rows_per_second", "Throughput of the last run of each ingest task.", ("task",)
+))
+INGEST_LAST_RUN = REGISTRY.register(Gauge(
+    "manrs_ingest_last_run_timestamp_seconds", "End of the last run of each ingest task (Unix time).", ("task",)
+))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def record_ingest(task: str, stats: Optional[Dict]):
+    # stats: dictionnaire renvoyé par bulk_upsert / diff_upsert
+    if not stats:
+        return
+    INGEST_RUNS.inc(task)
+    INGEST_ROWS.inc(task, amount=stats["rows"])
+    INGEST_SECONDS.inc(task, amount=stats["seconds"])
+    INGEST_THROUGHPUT.set(stats["rows_per_second"], task)
+    INGEST_LAST_RUN.set(round(time.time(), 3), task)
+
+
+def record_rovista_fetch(seconds: float, status=None, error: Optional[str] = None):
+    ROVISTA_LATENCY.observe(seconds, "error" if status is None else str(status))
+    if error:
+        ROVISTA_ERRORS.inc(error)
+
+
+def cache_metrics(caches) -> List[Metric]:
+    # Compteurs de LRUCache lus au moment de la collecte: aucun coût sur get/put
+    hits = Counter("manrs_cache_hits_total", "Cache lookups that found an entry.", ("cache",))
+    misses = Counter("manrs_cache_misses_total", "Cache lookups that missed.", ("cache",))
+    ratio = Gauge("manrs_cache_hit_ratio", "Hits over lookups since the process started.", ("cache",))
+    size = Gauge("manrs_cache_entries", "Entries currently held.", ("cache",))
+    maxsize = Gauge("manrs_cache_max_entries", "Configured capacity.", ("cache",))
+    size_bytes = Gauge("manrs_cache_bytes", "Bytes held by caches bounded by size.", ("cache",))
+    for cache in caches:
+        stats = cache.stats()
+        hits.inc(stats["name"], amount=stats["hits"])
+        misses.inc(stats["name"], amount=stats["misses"])
+        ratio.set(stats["hit_ratio"], stats["name"])
+        size.set(stats["size"], stats["name"])
+        maxsize.set(stats["maxsize"], stats["name"])
+        if stats["maxbytes"] is not None:
+            size_bytes.set(stats["bytes"], stats["name"])
+    return [hits, misses, ratio, size, maxsize, size_bytes]
+
+
+# Compteur de requêtes SQL de la requête HTTP en cours. Le contexte est copié
+# vers les threads des routes synchrones et des réponses en flux: la liste,
+# elle, est partagée et reçoit leurs requêtes.
+_request_queries: contextvars.ContextVar = contextvars.ContextVar("manrs_request_queries", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    # Les curseurs DBAPI bruts (bulk_upsert, export) ne passent pas par ici
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latence, statut et nombre de requêtes SQL par route.
+
+    La route est le gabarit déclaré (``/asn/``), retrouvé par l'endpoint que le
+    routeur écrit dans le scope. La mesure s'arrête au dernier octet du corps:
+    les réponses en flux comptent en entier, les tâches de fond non.
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+        self._paths = {}
+
+    def route_label(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        path = self._paths.get(endpoint)
+        if path is None:
+            # app.routes grandit au fil des décorateurs: résolu à la première requête
+            self._paths = {getattr(route, "endpoint", None): route.path for route in self.routes}
+            path = self._paths.get(endpoint, UNMATCHED_ROUTE)
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        queries = [0]
+        status = [500]
+        recorded = [False]
+        token = _request_queries.set(queries)
+
+        def record():
+            recorded[0] = True
+            method, route = scope["method"], self.route_label(scope)
+            HTTP_REQUESTS.inc(method, route, str(status[0]))
+            HTTP_LATENCY.observe(time.perf_counter() - started, method, route)
+            HTTP_DB_QUERIES.observe(queries[0], method, route)
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not recorded[0]:
+                record()
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _request_queries.reset(token)
+            if not recorded[0]:
+                record()
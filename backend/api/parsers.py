@@ -0,0 +1,77 @@
+from array import array
+from typing import Iterator, List, Optional
+
+from .function import iter_file_content
+from .graph import iter_as_rel_edges, PEER_TO_PEER, PROVIDER_TO_CUSTOMER
+from .pipeline import iter_source_lines
+
+# Ligne de format qui précède les enregistrements dans nro-delegated-stats
+DELEGATED_STATS_MARKER = "iana|ZZ|asn|0|1|20140311|reserved|ietf|iana"
+DELEGATED_STATS_FIELDS = ["registry", "cc", "type", "start", "value", "date", "status", "opaque_id", "extensions"]
+
+
+def parse_delegated_stats_line(entry: str):
+    # registry|cc|type|start|value|date|status|opaque-id[|extensions...]
+    fields = entry.strip().split('|')
+    if len(fields) < 8:
+        return None
+    fields = fields[:8] + ['|'.join(fields[8:])]
+    return dict(zip(DELEGATED_STATS_FIELDS, fields))
+
+
+def iter_delegated_stats_rows(file_path: str) -> Iterator[dict]:
+    found_format_line = False
+    for entry in iter_file_content(file_path):
+        if entry.startswith(DELEGATED_STATS_MARKER):
+            found_format_line = True
+            continue
+        if found_format_line and entry:
+            row = parse_delegated_stats_line(entry)
+            if row is not None:
+                yield row
+
+
+def iter_as_mapping_rows(file_path: str) -> Iterator[dict]:
+    for asn, data in iter_file_content(file_path):
+        yield {
+            "asn": asn,
+            "status": data.get("Status", ""),
+            "reference_orgs": str(data.get("Reference Orgs", [])),
+            "sibling_asns": str(data.get("Sibling ASNs", [])),
+            "name": data.get("Name", ""),
+            "descr": data.get("Descr", ""),
+            "website": data.get("Website", ""),
+            "comparison_with_ca2O": data.get("Comparison with CA2O", ""),
+            "comparison_with_pdb": data.get("Comparison with PDB", ""),
+            "pdb_org_id": data.get("PDB.org_id", ""),
+            "pdb_org": data.get("PDB.org", ""),
+        }
+
+
+def parse_sibling_asns(value: Optional[str]) -> List[str]:
+    # Inverse de str(...) ci-dessus: "['1', '2']" ou "[1, 2]" -> ["1", "2"]
+    if not value:
+        return []
+    return [item.strip().strip("'\"") for item in value.strip("[]").split(",") if item.strip()]
+
+
+def iter_categorized_rows(file_path: str) -> Iterator[dict]:
+    for entry in iter_file_content(file_path):
+        yield {
+            "asn": entry['ASN'].replace('AS', ''),
+            "category_1": entry['Category 1 - Layer 1'],
+            "category_2": entry['Category 1 - Layer 2'],
+        }
+
+
+def read_as_rel_edges(file_path: str):
+    # Trois tableaux compacts (source, destination, relation): peu coûteux à
+    # transmettre entre processus, contrairement à une liste de tuples.
+    # file_path peut être une URL CAIDA, lue en flux sans fichier intermédiaire
+    sources, destinations, relations = array("I"), array("I"), array("b")
+    for source, destination, relation in iter_as_rel_edges(iter_source_lines(file_path)):
+        if relation in (PEER_TO_PEER, PROVIDER_TO_CUSTOMER):
+            sources.append(source)
+            destinations.append(destination)
+            relations.append(relation)
+    return sources, destinations, relations
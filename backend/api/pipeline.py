@@ -0,0 +1,118 @@
+import bz2
+import codecs
+import queue
+import threading
+from typing import Iterable, Iterator
+
+import httpx
+
+from .function import iter_batches, iter_file_content
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+STREAM_TIMEOUT = 60.0
+# Lots de lignes en transit entre le thread de téléchargement et le chargement
+PIPELINE_BATCH_SIZE = 10000
+PIPELINE_QUEUE_SIZE = 8
+
+
+def iter_http_chunks(url: str, chunk_size: int = STREAM_CHUNK_SIZE, timeout: float = STREAM_TIMEOUT) -> Iterator[bytes]:
+    with httpx.stream("GET", url, timeout=timeout, follow_redirects=True) as response:
+        response.raise_for_status()
+        yield from response.iter_bytes(chunk_size)
+
+
+def iter_bz2_decompress(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    decompressor = bz2.BZ2Decompressor()
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            # Archives multi-flux (pbzip2): un nouveau flux commence après eof
+            if decompressor.eof:
+                chunk = decompressor.unused_data
+                decompressor = bz2.BZ2Decompressor()
+            else:
+                chunk = b""
+
+
+def iter_lines(chunks: Iterable[bytes], encoding: str = "utf-8") -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    pending = ""
+    for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.strip()
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.strip()
+
+
+def iter_remote_lines(url: str) -> Iterator[str]:
+    # Décompression à la volée: aucun fichier intermédiaire
+    chunks = iter_http_chunks(url)
+    if url.endswith(".bz2"):
+        chunks = iter_bz2_decompress(chunks)
+    return iter_lines(chunks)
+
+
+def is_remote_source(path: str) -> bool:
+    return path.startswith(("http://", "https://"))
+
+
+def iter_source_lines(path: str) -> Iterator[str]:
+    # URL: téléchargée et décompressée dans un thread pendant l'analyse; sinon fichier local
+    if is_remote_source(path):
+        return iter_prefetched(iter_remote_lines(path))
+    return iter_file_content(path)
+
+
+class _ProducerError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def iter_prefetched(items: Iterable, batch_size: int = PIPELINE_BATCH_SIZE, maxsize: int = PIPELINE_QUEUE_SIZE):
+    """Consomme ``items`` dans un thread producteur, par lots, via une file bornée.
+
+    Réseau et décompression avancent pendant que l'appelant analyse et écrit en
+    base; la file bornée limite la mémoire si l'écriture est plus lente. Une
+    exception du producteur est relancée côté consommateur.
+    """
+    batches = queue.Queue(maxsize)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for batch in iter_batches(items, batch_size):
+                if not put(batch):
+                    return
+            put(done)
+        except BaseException as e:
+            put(_ProducerError(e))
+
+    thread = threading.Thread(target=produce, name="pipeline-producer", daemon=True)
+    thread.start()
+    try:
+        while True:
+            batch = batches.get()
+            if batch is done:
+                return
+            if isinstance(batch, _ProducerError):
+                raise batch.error
+            yield from batch
+    finally:
+        # Consommateur interrompu: le producteur s'arrête au prochain lot
+        stop.set()
+        thread.join()
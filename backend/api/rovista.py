@@ -0,0 +1,168 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+import httpx
+
+from .metrics import record_rovista_fetch
+
+logger = logging.getLogger(__name__)
+# httpx journalise chaque requête en INFO: trop bavard pour des milliers de CSV
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+ROVISTA_BASE_URL = os.environ.get("MANRS_ROVISTA_URL", "https://rovista.netsecurelab.org/data")
+ROVISTA_CACHE_DIR = os.environ.get("MANRS_ROVISTA_CACHE_DIR", "csv_files")
+ROVISTA_MAX_CONNECTIONS = 20
+ROVISTA_CONCURRENCY = 10
+ROVISTA_TIMEOUT = 10.0
+
+
+def parse_ratio_history(content: str):
+    # CSV RoVista par ASN: colonnes date (AAAA-MM-JJ) et ratio
+    for row in csv.DictReader(io.StringIO(content)):
+        if not row.get("date") or not row.get("ratio"):
+            continue
+        try:
+            ratio_date = datetime.strptime(row["date"], "%Y-%m-%d").date()
+            ratio = float(row["ratio"])
+        except ValueError:
+            continue
+        yield ratio_date, ratio
+
+
+def parse_latest_ratio(content: str):
+    latest_ratio = None
+    for ratio_date, ratio in parse_ratio_history(content):
+        if latest_ratio is None or ratio_date > latest_ratio["date"]:
+            latest_ratio = {"date": ratio_date, "ratio": ratio}
+    return latest_ratio
+
+
+def parse_overview_asn(value) -> str:
+    # Dans overview.json, le champ asn est un lien HTML: <a href="...">13335</a>
+    return re.sub(r"<[^>]*>", "", str(value)).strip()
+
+
+class RovistaFetcher:
+    """Client RoVista asynchrone: pool de connexions partagé, concurrence bornée
+    et cache disque des CSV revalidé par GET conditionnel (ETag/Last-Modified).
+    """
+
+    def __init__(
+        self,
+        base_url: str = ROVISTA_BASE_URL,
+        cache_dir: Optional[str] = ROVISTA_CACHE_DIR,
+        concurrency: int = ROVISTA_CONCURRENCY,
+        timeout: float = ROVISTA_TIMEOUT,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.cache_dir = cache_dir
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+
+    def _ensure_client(self):
+        # Le client et le sémaphore sont liés à la boucle d'événements courante
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=ROVISTA_MAX_CONNECTIONS, max_keepalive_connections=ROVISTA_MAX_CONNECTIONS),
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+
+    def _cache_paths(self, asn):
+        return (
+            os.path.join(self.cache_dir, f"{asn}.csv"),
+            os.path.join(self.cache_dir, f"{asn}.meta.json"),
+        )
+
+    def _read_cache(self, asn):
+        if not self.cache_dir:
+            return None, {}
+        body_path, meta_path = self._cache_paths(asn)
+        if not os.path.exists(body_path):
+            return None, {}
+        with open(body_path, "r", newline="") as file:
+            body = file.read()
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as file:
+                meta = json.load(file)
+        return body, meta
+
+    def _write_cache(self, asn, body: str, meta: Dict[str, str]):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for path, content in zip(self._cache_paths(asn), (body, json.dumps(meta))):
+            with open(f"{path}.tmp", "w", newline="") as file:
+                file.write(content)
+            os.replace(f"{path}.tmp", path)
+
+    async def fetch_csv(self, asn) -> Optional[str]:
+        client = self._ensure_client()
+        cached_body, meta = await asyncio.to_thread(self._read_cache, asn)
+        headers = {}
+        if cached_body is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        async with self._semaphore:
+            # Latence mesurée hors de l'attente du sémaphore
+            started = time.perf_counter()
+            try:
+                response = await client.get(f"{self.base_url}/asn/{asn}.csv", headers=headers)
+            except httpx.HTTPError as e:
+                record_rovista_fetch(time.perf_counter() - started, error=type(e).__name__)
+                logger.warning("RoVista fetch failed for AS%s: %s", asn, e)
+                return cached_body
+        record_rovista_fetch(
+            time.perf_counter() - started, response.status_code,
+            None if response.status_code in (200, 304) else f"http_{response.status_code}",
+        )
+
+        if response.status_code == 304:
+            return cached_body
+        if response.status_code != 200:
+            logger.warning("RoVista fetch for AS%s returned HTTP %d", asn, response.status_code)
+            return cached_body if response.status_code >= 500 else None
+
+        meta = {
+            "etag": response.headers.get("etag", ""),
+            "last_modified": response.headers.get("last-modified", ""),
+        }
+        await asyncio.to_thread(self._write_cache, asn, response.text, meta)
+        return response.text
+
+    async def latest_ratio(self, asn):
+        content = await self.fetch_csv(asn)
+        return parse_latest_ratio(content) if content else None
+
+    async def fetch_csvs(self, asns: Iterable[str]):
+        asns = list(dict.fromkeys(str(asn) for asn in asns))
+        contents = await asyncio.gather(*(self.fetch_csv(asn) for asn in asns))
+        return dict(zip(asns, contents))
+
+    async def latest_ratios(self, asns: Iterable[str]):
+        asns = list(dict.fromkeys(str(asn) for asn in asns))
+        ratios = await asyncio.gather(*(self.latest_ratio(asn) for asn in asns))
+        return dict(zip(asns, ratios))
@@ -81,7 +81,7 @@ def find_asn_data(db: Session, asn):
 
 def find_by_category(db: Session, category: str):
     data1 = db.query(ManrsTable).filter(ManrsTable.category_1 == category).all()
-    data2 = db.query(ManrsTable).filter(ManrsTable.category_1 == category).all()
+    data2 = db.query(ManrsTable).filter(ManrsTable.category_2 == category).all()
     merged_data = list(set(data1 + data2))
     return merged_data
 
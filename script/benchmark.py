@@ -0,0 +1,224 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Run from anywhere: the backend package lives at the repository root
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from build_database import SOURCES, find_source  # noqa: E402
+
+# Metrics compared by --compare: lower is better for all of them
+COMPARED_KEYS = ('seconds', 'p50_ms', 'p95_ms')
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def latency_summary(samples):
+    # samples in seconds, reported in milliseconds
+    ms = [s * 1000 for s in samples]
+    return {
+        'count': len(ms),
+        'mean_ms': round(sum(ms) / len(ms), 4),
+        'p50_ms': round(percentile(ms, 0.50), 4),
+        'p95_ms': round(percentile(ms, 0.95), 4),
+        'p99_ms': round(percentile(ms, 0.99), 4),
+        'max_ms': round(max(ms), 4),
+    }
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def sample_latencies(function, items, before=None):
+    samples = []
+    for item in items:
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        function(item)
+        samples.append(time.perf_counter() - started)
+    return latency_summary(samples)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ingest_result(seconds, stats):
+    rows = (stats or {}).get('rows', 0)
+    return {'seconds': round(seconds, 4), 'rows': rows, 'rows_per_second': round(rows / seconds) if seconds else None}
+
+
+def bench_ingest(api, db, paths, results):
+    # Same order as a first load: country index needs delegated, the graph needs as-rel
+    tasks = [
+        ('delegated_stats_task', api.delegated_stats_task, paths['delegated']),
+        ('dataset_as_mapping_task', api.dataset_as_mapping_task, paths['as_org']),
+        ('categorized_asn_task', api.categorized_asn_task, paths['categorized']),
+        ('relationship_asn_task', api.relationship_asn_task, paths['as_rel']),
+    ]
+    # Each full reload rebuilds its derived tables and the ASN documents
+    for name, task, path in tasks:
+        print(f'ingest {name}...', flush=True)
+        results[f'ingest.{name}'] = ingest_result(*timed(task, path, db))
+    # All four sources, derived tables and documents rebuilt once at the end
+    print('ingest reload_sources_task...', flush=True)
+    results['ingest.reload_sources_task'] = ingest_result(*timed(api.reload_sources_task, paths, db))
+    # Same files again: measures the diff of an incremental ingest with nothing to write
+    for name, task, path in tasks:
+        print(f'ingest {name} (incremental, unchanged)...', flush=True)
+        results[f'ingest_incremental.{name}'] = ingest_result(*timed(task, path, db, incremental=True))
+
+
+def clear_caches(api):
+    for cache in (api.asn_document_cache, api.asn_response_cache):
+        cache.clear()
+
+
+def bench_queries(api, db, asns, batch_size, results):
+    print('find_asn_data...', flush=True)
+    results['find_asn_data.cold'] = sample_latencies(lambda asn: api.find_asn_data(db, asn), asns, lambda: clear_caches(api))
+    results['find_asn_data.warm'] = sample_latencies(lambda asn: api.find_asn_data(db, asn), asns)
+    batch = asns[:batch_size]
+    seconds, _ = timed(api.find_asn_data_batch, db, batch, None, False)
+    results['find_asn_data_batch'] = {'seconds': round(seconds, 4), 'asns': len(batch)}
+
+
+def bench_http(api, asns, batch_size, results):
+    from fastapi.testclient import TestClient
+
+    print('http...', flush=True)
+    started = time.perf_counter()
+    with TestClient(api.app) as client:
+        # Startup loads the relationship graph
+        results['http.startup'] = {'seconds': round(time.perf_counter() - started, 4)}
+        results['http.asn.cold'] = sample_latencies(lambda asn: client.get('/asn/', params={'asn': asn}), asns, lambda: clear_caches(api))
+        results['http.asn.warm'] = sample_latencies(lambda asn: client.get('/asn/', params={'asn': asn}), asns)
+        results['http.asn_document'] = sample_latencies(lambda asn: client.get('/asn/document/', params={'asn': asn}), asns)
+        clear_caches(api)
+        batch = asns[:batch_size]
+        seconds, _ = timed(client.post, '/asn/batch/', json={'asns': batch})
+        results['http.asn_batch'] = {'seconds': round(seconds, 4), 'asns': len(batch)}
+
+
+def bench_graph(api, as_rel_path, asns, graph_path, results):
+    from backend.api.graph import AsGraph, PROVIDERS, CUSTOMERS
+
+    print('graph...', flush=True)
+    seconds, graph = timed(AsGraph.from_as_rel_file, as_rel_path)
+    results['graph.build'] = {'seconds': round(seconds, 4), 'asns': len(graph), 'edges': graph.edge_count}
+    results['graph.save'] = {'seconds': round(timed(graph.save, graph_path)[0], 4)}
+    seconds, graph = timed(AsGraph.load, graph_path)
+    results['graph.load'] = {'seconds': round(seconds, 4)}
+
+    results['graph.providers'] = sample_latencies(graph.providers, asns)
+    results['graph.customers'] = sample_latencies(graph.customers, asns)
+    for kind in (PROVIDERS, CUSTOMERS):
+        results[f'graph.cone.{kind}'] = sample_latencies(
+            lambda asn: graph.cone(asn, kind), asns, graph.cone_cache.clear
+        )
+
+
+def run(source_dir, output, sample_size=200, batch_size=1000, seed=1, work_dir=None):
+    paths = {kind: find_source(source_dir, kind) for kind in SOURCES}
+    missing = [kind for kind, path in paths.items() if path is None]
+    if missing:
+        raise SystemExit(f'missing {", ".join(missing)} in {source_dir}: run script/generate_dataset.py first')
+
+    work_dir = work_dir or tempfile.mkdtemp(prefix='manrs-benchmark-')
+    os.makedirs(work_dir, exist_ok=True)
+    database_path = os.path.join(work_dir, 'benchmark.db')
+    for suffix in ('', '-wal', '-shm', '.graph'):
+        if os.path.exists(database_path + suffix):
+            os.remove(database_path + suffix)
+    # The API reads its settings at import time
+    os.environ['MANRS_DATABASE_URL'] = f'sqlite:///{database_path}'
+    os.environ.pop('MANRS_DB_READ_ONLY', None)
+    os.environ.pop('MANRS_AS_REL_PATH', None)
+    os.environ['MANRS_GRAPH_PATH'] = database_path + '.graph'
+    from backend.api import main as api
+
+    results = {}
+    # Tables created by the app's startup hook, before it runs: the ingest needs them now
+    api.create_tables()
+    db = api.SessionLocal()
+    try:
+        bench_ingest(api, db, paths, results)
+        all_asns = sorted(row.asn for row in db.query(api.DatasetASMappingTable.asn))
+        asns = random.Random(seed).sample(all_asns, min(sample_size, len(all_asns)))
+        bench_queries(api, db, asns, batch_size, results)
+    finally:
+        db.close()
+    bench_http(api, asns, batch_size, results)
+    bench_graph(api, paths['as_rel'], asns, os.path.join(work_dir, 'benchmark.graph'), results)
+
+    report = {
+        'revision': git_revision(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'dataset': {
+            kind: {'file': os.path.basename(path), 'bytes': os.path.getsize(path)} for kind, path in paths.items()
+        },
+        'parameters': {'sample_size': len(asns), 'batch_size': batch_size, 'seed': seed},
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def compare(report, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"{'benchmark':<44} {'metric':>8} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for name, current in report['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        for key in COMPARED_KEYS:
+            if key in current and previous.get(key):
+                print(f"{name:<44} {key:>8} {previous[key]:>12.4f} {current[key]:>12.4f} {current[key] / previous[key]:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the loaders, ASN lookups, /asn/ and graph traversals.')
+    parser.add_argument('source_dir', help='dataset directory (e.g. from script/generate_dataset.py)')
+    parser.add_argument('--output', default=None, help='results file (default: benchmark-<revision>-<date>.json)')
+    parser.add_argument('--sample-size', type=int, default=200, help='ASNs timed per lookup benchmark')
+    parser.add_argument('--batch-size', type=int, default=1000, help='ASNs per batch lookup')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--work-dir', default=None, help='where to build the benchmark database (default: a temp dir)')
+    parser.add_argument('--compare', default=None, help='previous results file to compare against')
+    args = parser.parse_args()
+
+    output = args.output or f"benchmark-{git_revision() or 'local'}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    report = run(args.source_dir, output, args.sample_size, args.batch_size, args.seed, args.work_dir)
+    print(f'Results written to {output}')
+    if args.compare:
+        compare(report, args.compare)
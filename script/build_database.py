@@ -0,0 +1,232 @@
+import argparse
+import glob
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Run from anywhere: the backend package lives at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.api.parsers import (  # noqa: E402
+    iter_as_mapping_rows, iter_categorized_rows, iter_delegated_stats_rows, read_as_rel_edges,
+)
+
+# Source kind -> file name patterns, as written by dowload_update_database.py
+SOURCES = {
+    'delegated': ['*delegated-stats*', '*delegated*'],
+    'as_org': ['*as-org*.json'],
+    'categorized': ['*categorized*.csv'],
+    'as_rel': ['*as-rel*.txt', '*as-rel*.txt.bz2'],
+}
+
+
+def find_source(source_dir, kind):
+    matches = sorted({
+        path for pattern in SOURCES[kind] for path in glob.glob(os.path.join(source_dir, pattern))
+        if not path.endswith(('.part', '.meta.json', '.tmp'))
+    })
+    # Latest snapshot: file names start with the date, so a decompressed copy
+    # left by an older download never shadows a newer .bz2
+    return matches[-1] if matches else None
+
+
+def parse_source(kind, path):
+    # Runs in a worker process: returns compact, picklable rows
+    started = time.perf_counter()
+    if kind == 'delegated':
+        payload = list(iter_delegated_stats_rows(path))
+    elif kind == 'as_org':
+        payload = list(iter_as_mapping_rows(path))
+    elif kind == 'categorized':
+        payload = list(iter_categorized_rows(path))
+    else:
+        payload = read_as_rel_edges(path)
+    return kind, payload, time.perf_counter() - started
+
+
+def load_source(api, db, kind, path, payload, incremental=False, derive=True):
+    if kind == 'delegated':
+        return api.load_delegated_stats(db, payload, path, incremental, derive)
+    if kind == 'as_org':
+        return api.load_as_mapping(db, payload, path, incremental, derive)
+    if kind == 'categorized':
+        return api.load_categorized_asn(db, payload, path, incremental, derive)
+    sources, destinations, relations = payload
+    return api.load_relationship_edges(db, zip(sources, destinations, relations), path, incremental, derive)
+
+
+def build_part(kind, path, part_path):
+    # Runs in a worker process: parse and bulk load one source into its own file.
+    # SQLite allows one writer per file, so each source gets a separate one.
+    from sqlalchemy.orm import sessionmaker
+    from backend.api import main as api
+    from backend.api.database import create_build_engine
+
+    started = time.perf_counter()
+    remove_database(part_path)
+    kind, payload, parse_seconds = parse_source(kind, path)
+    engine = create_build_engine(part_path)
+    db = sessionmaker(bind=engine)()
+    try:
+        stats = load_source(api, db, kind, path, payload, derive=False)
+    finally:
+        db.close()
+        engine.dispose()
+    # The graph is rebuilt by the parent from the as-rel arrays
+    edges = payload if kind == 'as_rel' else None
+    return kind, part_path, parse_seconds, time.perf_counter() - started - parse_seconds, stats, edges
+
+
+def remove_database(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def merge_part(db, part_path):
+    # Plain INSERT ... SELECT between attached files: no Python per row.
+    # Ids are reassigned, sources never share a unique key.
+    from backend.api.database import Base
+
+    connection = db.connection().connection
+    connection.execute("ATTACH DATABASE ? AS part", (part_path,))
+    try:
+        for table in Base.metadata.sorted_tables:
+            columns = ", ".join('"%s"' % c.name for c in table.columns if not c.primary_key)
+            connection.execute(
+                f'INSERT INTO main."{table.name}" ({columns}) SELECT {columns} FROM part."{table.name}" ORDER BY rowid'
+            )
+        connection.commit()
+    finally:
+        connection.execute("DETACH DATABASE part")
+    remove_database(part_path)
+
+
+def build(paths, output, build_path=None, workers=4, incremental=False, publish=True, export_dir=None):
+    """Build the database from the four sources into build_path, then publish it.
+
+    A full build parses and loads every source in its own worker process and
+    SQLite file, then merges the files with INSERT ... SELECT: the build takes
+    about as long as the slowest source. An incremental build diffs against a
+    copy of the served database; parsing still runs in parallel but the diffs
+    are applied by this process, the only writer of that copy. With export_dir,
+    the Parquet export of the new snapshot is written before publishing. The
+    relationship graph is saved next to the database for the API to mmap.
+    """
+    from sqlalchemy.orm import sessionmaker
+    from backend.api import main as api
+    from backend.api.database import create_build_engine, publish_database, relationship_snapshot
+    from backend.api.graph import AsGraph
+
+    build_path = build_path or f'{output}.build'
+    remove_database(build_path)
+    if incremental and os.path.exists(output):
+        # Diff against a copy of the served database, never the file in use
+        shutil.copyfile(output, build_path)
+
+    timings = []
+    started = time.perf_counter()
+    db = sessionmaker(bind=create_build_engine(build_path))()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            if incremental:
+                # Documents written before the as-rel diff use the served graph, like the API
+                api.relationship_graph = api.load_graph_snapshot(f'{output}.graph', relationship_snapshot(db))
+                futures = [executor.submit(parse_source, kind, path) for kind, path in paths.items()]
+                for future in as_completed(futures):
+                    kind, payload, parse_seconds = future.result()
+                    load_started = time.perf_counter()
+                    stats = load_source(api, db, kind, paths[kind], payload, incremental=True)
+                    del payload
+                    timings.append((kind, parse_seconds, time.perf_counter() - load_started, 0.0, stats))
+            else:
+                futures = [
+                    executor.submit(build_part, kind, path, f'{build_path}.{kind}')
+                    for kind, path in paths.items()
+                ]
+                graph = None
+                for future in as_completed(futures):
+                    kind, part_path, parse_seconds, load_seconds, stats, edges = future.result()
+                    merge_started = time.perf_counter()
+                    merge_part(db, part_path)
+                    if edges is not None:
+                        graph = AsGraph.from_edges(zip(*edges))
+                    timings.append((kind, parse_seconds, load_seconds, time.perf_counter() - merge_started, stats))
+
+                derive_started = time.perf_counter()
+                stats = api.rebuild_derived_tables(db, graph) or {"rows": 0}
+                timings.append(('derived', 0.0, time.perf_counter() - derive_started, 0.0, stats))
+
+        if incremental:
+            graph = api.relationship_graph
+        graph_started = time.perf_counter()
+        # Written before the database: workers reopening the new file find it in place
+        graph.version = relationship_snapshot(db)
+        graph.save(f'{output if publish else build_path}.graph')
+        timings.append(('graph', 0.0, time.perf_counter() - graph_started, 0.0, {"rows": len(graph)}))
+
+        if export_dir:
+            import pyarrow.parquet as pq
+            from backend.api.export import export_snapshot
+            export_started = time.perf_counter()
+            export_path = export_snapshot(db, 'parquet', graph, export_dir)
+            stats = {"rows": pq.read_metadata(export_path).num_rows}
+            timings.append(('export', 0.0, time.perf_counter() - export_started, 0.0, stats))
+    finally:
+        db.close()
+
+    publish_seconds = None
+    if publish:
+        publish_started = time.perf_counter()
+        publish_database(build_path, output)
+        publish_seconds = time.perf_counter() - publish_started
+    return timings, publish_seconds, time.perf_counter() - started
+
+
+def print_timings(timings, publish_seconds, total):
+    # Sources are processed concurrently: the total is not the sum of the stages
+    print(f"{'stage':<12} {'parse (s)':>10} {'load (s)':>10} {'merge (s)':>10} {'rows':>10} {'changes':>10}")
+    for stage, parse_seconds, load_seconds, merge_seconds, stats in timings:
+        changes = sum(stats[key] for key in ('inserted', 'updated', 'deleted')) if 'inserted' in stats else '-'
+        print(
+            f"{stage:<12} {parse_seconds:>10.2f} {load_seconds:>10.2f} {merge_seconds:>10.2f} "
+            f"{stats['rows']:>10} {changes:>10}"
+        )
+    if publish_seconds is not None:
+        print(f"{'publish':<12} {'':>10} {publish_seconds:>10.2f}")
+    print(f"{'total':<12} {total:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the MANRS database from the downloaded datasets.')
+    parser.add_argument('source_dir', help='directory with the downloaded files (e.g. manrs_2023-08)')
+    parser.add_argument('--output', default=None, help='served database (default: MANRS_DATABASE_URL path)')
+    parser.add_argument('--build-path', default=None, help='side file to build into (default: <output>.build)')
+    parser.add_argument('--workers', type=int, default=min(len(SOURCES), os.cpu_count() or 1))
+    parser.add_argument('--incremental', action='store_true', help='apply only the differences to a copy of the served database')
+    parser.add_argument('--no-publish', action='store_true', help='leave the result in the build file')
+    parser.add_argument('--export-dir', default=None, help='also write the Parquet export of the snapshot here')
+    for kind in SOURCES:
+        source_help = f'{kind} file (default: found in source_dir)'
+        if kind == 'as_rel':
+            source_help += '; an http(s) URL is downloaded and decompressed while it is parsed'
+        parser.add_argument(f"--{kind.replace('_', '-')}", default=None, help=source_help)
+    args = parser.parse_args()
+
+    paths = {}
+    for kind in SOURCES:
+        path = getattr(args, kind) or find_source(args.source_dir, kind)
+        if path is None:
+            parser.error(f'no {kind} file found in {args.source_dir}')
+        paths[kind] = path
+
+    if args.output is None:
+        from backend.api.database import sqlite_path
+        args.output = sqlite_path()
+
+    timings, publish_seconds, total = build(
+        paths, args.output, args.build_path, args.workers, args.incremental, not args.no_publish, args.export_dir
+    )
+    print_timings(timings, publish_seconds, total)
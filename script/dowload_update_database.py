@@ -1,7 +1,12 @@
-import requests
+import argparse
+import hashlib
+import json
 import os
-import bz2
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+
+import requests
 from tqdm import tqdm
 
 # List of file URLs to download
@@ -28,51 +33,194 @@ urls = [
     },
 ]
 
-# Function to download and save a file
-def download_file(url, filename):
+# Overrides every source URL, e.g. a local mirror or a test server
+BASE_URL = os.environ.get('MANRS_DOWNLOAD_BASE_URL')
+CHUNK_SIZE = 1024 * 1024
+# (connect, read) timeouts in seconds
+TIMEOUT = (10, 60)
+MAX_RETRIES = 5
+BACKOFF = 2.0
+MAX_WORKERS = 4
+
+
+class DownloadError(Exception):
+    pass
+
+
+def default_output_dir():
     # Create a directory with the current timestamp
-    current_time = datetime.now().strftime("%Y-%m-%d")
-    path = f'manrs_{current_time}'
-    
+    return f'manrs_{datetime.now().strftime("%Y-%m-%d")}'
+
+
+def read_meta(path):
     if not os.path.exists(path):
-        os.makedirs(path)
-        
-    response = requests.get(f'{url}/{filename}', stream=True)
-    if response.status_code == 200:
-        file_path = os.path.join(path, filename)
-        with open(file_path, 'wb') as f:
-            if filename.endswith('.bz2'):
-                # Save the compressed content to a file with tqdm
-                total_size = int(response.headers.get('content-length', 0))
-                with tqdm(total=total_size, unit='B', unit_scale=True, desc=f'Downloading {filename}') as pbar:
-                    for data in response.iter_content(chunk_size=1024):
-                        pbar.update(len(data))
-                        f.write(data)
-                # Decompress the downloaded file with tqdm
-                decompressed_path = file_path.replace('.bz2', '')
-                with tqdm(total=os.path.getsize(file_path), unit='B', unit_scale=True, desc=f'Decompressing {filename}') as pbar:
-                    with open(decompressed_path, 'wb') as decompressed_file, bz2.BZ2File(file_path, 'rb') as compressed_file:
-                        for data in iter(lambda: compressed_file.read(100 * 1024), b''):
-                            pbar.update(len(data))
-                            decompressed_file.write(data)
-                # Clean up the compressed file
-                os.remove(file_path)
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_meta(path, meta):
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(data)
+    return digest
+
+
+def expected_total(response, offset):
+    # 206: "Content-Range: bytes 100-199/200"; 200: Content-Length is the full size
+    if response.status_code == 206:
+        total = response.headers.get('content-range', '').rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get('content-length')
+    return int(length) if length and length.isdigit() else None
+
+
+def fetch(session, url, file_path, sha256=None, position=0):
+    """Download url to file_path and return 'downloaded' or 'unchanged'.
+
+    The file is written to file_path.part and only moved into place once its
+    size (and sha256 when given) has been checked. A .part left by an
+    interrupted run is resumed with an HTTP Range request; the validators of a
+    complete download are kept in file_path.meta.json for conditional GETs.
+    """
+    part_path = f'{file_path}.part'
+    meta_path = f'{file_path}.meta.json'
+    part_meta_path = f'{part_path}.meta.json'
+    meta = read_meta(meta_path) if os.path.exists(file_path) else {}
+    part_meta = read_meta(part_meta_path)
+
+    # Sizes, Range offsets and sha256 all refer to the file as stored on the server:
+    # a compressed transfer (GitHub raw gzips by default) would be decoded by requests
+    headers = {'Accept-Encoding': 'identity'}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+        # Resume only if the remote file is still the one the .part started from
+        validator = part_meta.get('etag') or part_meta.get('last_modified')
+        if validator:
+            headers['If-Range'] = validator
+
+    with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code == 304:
+            return 'unchanged'
+        if response.status_code == 416:
+            # The .part is unusable (e.g. longer than the remote file): start over
+            os.remove(part_path)
+            raise DownloadError(f'{url}: range not satisfiable, restarting')
+        if response.status_code not in (200, 206):
+            raise DownloadError(f'{url}: HTTP {response.status_code}')
+
+        encoded = response.headers.get('content-encoding', 'identity').lower() != 'identity'
+        if encoded and response.status_code == 206:
+            # The range was taken in encoded bytes: appending decoded ones would corrupt the file
+            os.remove(part_path)
+            raise DownloadError(f'{url}: compressed partial response, restarting')
+        if response.status_code == 200:
+            offset = 0
+        digest = file_sha256(part_path) if offset else hashlib.sha256()
+        # Content-Length of a compressed response is not the size of the decoded file
+        total = None if encoded else expected_total(response, offset)
+        validators = {
+            'etag': response.headers.get('etag', ''),
+            'last_modified': response.headers.get('last-modified', ''),
+        }
+        if response.status_code == 200:
+            write_meta(part_meta_path, validators)
+        else:
+            validators = {k: v or part_meta.get(k, '') for k, v in validators.items()}
+
+        with open(part_path, 'ab' if offset else 'wb') as f, tqdm(
+            total=total, initial=offset, unit='B', unit_scale=True,
+            desc=os.path.basename(file_path), position=position, leave=False,
+        ) as pbar:
+            for data in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(data)
+                digest.update(data)
+                pbar.update(len(data))
+
+    size = os.path.getsize(part_path)
+    if total is not None and size != total:
+        raise DownloadError(f'{url}: got {size} bytes, expected {total}')
+    if sha256 and digest.hexdigest() != sha256:
+        os.remove(part_path)
+        raise DownloadError(f'{url}: sha256 mismatch')
+
+    os.replace(part_path, file_path)
+    validators.update(size=size, sha256=digest.hexdigest())
+    write_meta(meta_path, validators)
+    if os.path.exists(part_meta_path):
+        os.remove(part_meta_path)
+    return 'downloaded'
+
+
+def download_file(url, filename, path=None, sha256=None, position=0):
+    path = path or default_output_dir()
+    os.makedirs(path, exist_ok=True)
+    file_path = os.path.join(path, filename)
+    source = f'{url}/{filename}'
+
+    # One session per download: requests.Session is not shared across threads
+    with requests.Session() as session:
+        for attempt in range(1, MAX_RETRIES + 1):
+            try:
+                status = fetch(session, source, file_path, sha256, position)
+                break
+            except (requests.RequestException, DownloadError) as e:
+                if attempt == MAX_RETRIES:
+                    raise DownloadError(f'{source}: giving up after {attempt} attempts ({e})')
+                time.sleep(BACKOFF ** attempt)
+
+    # .bz2 files are kept as is: build_database.py decompresses them while parsing
+    return status
+
+
+def download_all(sources, path=None, base_url=BASE_URL, workers=MAX_WORKERS):
+    path = path or default_output_dir()
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for position, source in enumerate(sources):
+            # Check if it's a dictionary (with 'url' and 'name') or a string URL
+            if isinstance(source, dict):
+                url, filename, sha256 = source['url'], source['name'], source.get('sha256')
             else:
-                # Use tqdm to show progress bar with filename
-                total_size = int(response.headers.get('content-length', 0))
-                with tqdm(total=total_size, unit='B', unit_scale=True, desc=filename) as pbar:
-                    for data in response.iter_content(chunk_size=1024):
-                        pbar.update(len(data))
-                        f.write(data)
-        print(f"Downloaded: {filename}")
-    else:
-        print(f"Failed to download: {filename}")
+                url, _, filename = source.rpartition('/')
+                sha256 = None
+            if base_url:
+                url = base_url.rstrip('/')
+            futures[executor.submit(download_file, url, filename, path, sha256, position)] = filename
+
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                results[filename] = future.result()
+            except DownloadError as e:
+                results[filename] = 'failed'
+                print(f"Failed to download: {filename} ({e})")
+            else:
+                print(f"{results[filename].capitalize()}: {filename}")
+    return results
+
 
 if __name__ == "__main__":
-    for url in urls:
-        # Check if it's a dictionary (with 'url' and 'name') or a string URL
-        if isinstance(url, dict):
-            download_file(url['url'], url['name'])
-        else:
-            filename = url.split('/')[-1]
-            download_file(url, filename)
+    parser = argparse.ArgumentParser(description='Download the MANRS source datasets.')
+    parser.add_argument('--output-dir', default=None, help='destination directory (default: manrs_<date>)')
+    parser.add_argument('--base-url', default=BASE_URL, help='fetch every file from this URL instead')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    args = parser.parse_args()
+
+    results = download_all(urls, args.output_dir, args.base_url, args.workers)
+    if 'failed' in results.values():
+        raise SystemExit(1)
@@ -0,0 +1,255 @@
+import argparse
+import bisect
+import bz2
+import csv
+import json
+import os
+import random
+
+# Same file names as dowload_update_database.py, so build_database.py finds them
+FILE_NAMES = {
+    'as_rel': '20230801.as-rel.txt',
+    'delegated': 'nro-delegated-stats',
+    'as_org': 'ii.as-org.v01.2023-01.json',
+    'categorized': '2023-05_categorized_ases.csv',
+}
+
+# Registry -> country codes it allocates in, weighted roughly like the real file
+REGISTRIES = {
+    'arin': ['US', 'US', 'US', 'CA', 'PR'],
+    'ripencc': ['DE', 'GB', 'RU', 'FR', 'NL', 'IT', 'PL', 'UA', 'ES', 'SE', 'CH', 'TR', 'IR'],
+    'apnic': ['AU', 'IN', 'CN', 'ID', 'JP', 'BD', 'KR', 'HK', 'VN', 'NZ'],
+    'lacnic': ['BR', 'BR', 'BR', 'AR', 'MX', 'CO', 'CL'],
+    'afrinic': ['ZA', 'NG', 'KE', 'BJ', 'GH', 'EG', 'TZ'],
+}
+REGISTRY_WEIGHTS = [30, 32, 18, 15, 5]
+
+CATEGORIES = {
+    'Computer and Information Technology': [
+        'Internet Service Provider (ISP)', 'Hosting and Cloud Provider', 'Phone Provider',
+        'Software Development', 'Technology Consulting Services', 'Satellite Communication', '',
+    ],
+    'Education and Research': ['Universities, Colleges, and other Post-Secondary', 'Research and Development Organizations', ''],
+    'Finance and Insurance': ['Banks, Credit Card Companies, Mortgage Providers', 'Insurance Carriers and Agencies', ''],
+    'Government and Public Administration': ['Government and Public Administration', 'Military, Security, and Defense', ''],
+    'Media, Publishing, and Broadcasting': ['Online Media', 'Radio and Television Providers', ''],
+    'Retail Stores, Wholesale, and E-commerce Sites': ['Other', ''],
+    'Health Care Services': ['Hospitals and Medical Centers', ''],
+    'Manufacturing': ['Automotive and Transportation', 'Electronics and Computer Components', ''],
+    'Other': ['Other', ''],
+}
+CATEGORY_WEIGHTS = [70, 8, 4, 4, 4, 3, 2, 3, 2]
+
+# Tier-1 clique: these ASNs peer with each other and have no provider
+CLIQUE_SIZE = 15
+# Share of the 16-bit ASN space in the sample, the rest is 32-bit
+SHARE_16_BIT = 0.6
+ASN_16_BIT = (1, 64495)
+ASN_32_BIT = (131072, 401308)
+# Largest organizations hold a few hundred ASNs; each lists all the others
+ORG_MAX_SIZE = 300
+
+
+def sample_asns(rng, count):
+    count_16 = min(int(count * SHARE_16_BIT), ASN_16_BIT[1] - ASN_16_BIT[0])
+    asns = rng.sample(range(ASN_16_BIT[0], ASN_16_BIT[1] + 1), count_16)
+    asns += rng.sample(range(ASN_32_BIT[0], ASN_32_BIT[1] + 1), count - count_16)
+    # Older networks have smaller numbers and attract more customers
+    return sorted(asns)
+
+
+def generate_edges(rng, asns, edge_count):
+    """Preferential attachment: every new AS picks providers among older ones
+    with probability proportional to their degree, which gives the power-law
+    degree distribution of the real graph. Peering links fill the remaining
+    edge budget, also between well-connected ASes.
+    """
+    node_count = len(asns)
+    # Provider links take about 45% of the edges, like in the CAIDA files
+    providers_per_node = max(1.0, 0.45 * edge_count / max(1, node_count - CLIQUE_SIZE))
+    edges = set()
+    relations = []
+    # Each node appears once per incident edge: uniform sampling is preferential
+    degree_list = []
+
+    def add(a, b, relation):
+        key = (min(a, b), max(a, b))
+        if a == b or key in edges:
+            return False
+        edges.add(key)
+        degree_list.extend((a, b))
+        relations.append((a, b, relation))
+        return True
+
+    clique = range(min(CLIQUE_SIZE, node_count))
+    for a in clique:
+        for b in clique:
+            if a < b:
+                add(a, b, 0)
+    for node in range(len(clique), node_count):
+        # 1 + geometric number of providers, mean providers_per_node
+        wanted = 1
+        while rng.random() < 1 - 1 / providers_per_node and wanted < 50:
+            wanted += 1
+        tries = 0
+        while wanted and tries < 20:
+            tries += 1
+            provider = rng.choice(degree_list) if degree_list and rng.random() < 0.9 else rng.randrange(node)
+            if provider < node and add(provider, node, -1):
+                wanted -= 1
+
+    attempts = 0
+    while len(relations) < edge_count and attempts < edge_count * 10:
+        attempts += 1
+        # Peering concentrates on well-connected networks (IXP members, content)
+        a = rng.choice(degree_list)
+        b = rng.choice(degree_list) if rng.random() < 0.9 else rng.randrange(node_count)
+        add(a, b, 0)
+
+    for a, b, relation in relations:
+        yield asns[a], asns[b], relation
+
+
+def write_as_rel(path, edges, compress=False):
+    opener = bz2.open if compress else open
+    with opener(path + ('.bz2' if compress else ''), 'wt') as f:
+        f.write('# source:topology|BGP|synthetic\n')
+        f.write('# input clique: (synthetic tier-1 peering clique)\n')
+        count = 0
+        for a, b, relation in edges:
+            f.write(f'{a}|{b}|{relation}\n')
+            count += 1
+    return count
+
+
+def write_delegated_stats(path, rng, asns, date='20230801'):
+    countries = {}
+    with open(path, 'w') as f:
+        f.write(f'2|nro|{date}|{len(asns) * 3}|19821105|{date}|+0000\n')
+        for kind in ('asn', 'ipv4', 'ipv6'):
+            f.write(f'nro|*|{kind}|*|{len(asns)}|summary\n')
+        f.write('iana|ZZ|asn|0|1|20140311|reserved|ietf|iana\n')
+        i = 0
+        while i < len(asns):
+            registry = rng.choices(list(REGISTRIES), REGISTRY_WEIGHTS)[0]
+            cc = rng.choice(REGISTRIES[registry])
+            # Some blocks cover consecutive ASNs, like the real allocations
+            block = 1
+            while i + block < len(asns) and asns[i + block] == asns[i] + block and block < 8 and rng.random() < 0.15:
+                block += 1
+            status = 'assigned' if rng.random() < 0.97 else rng.choice(['available', 'reserved'])
+            if status != 'assigned':
+                f.write(f'{registry}||asn|{asns[i]}|{block}||{status}|\n')
+            else:
+                day = f'{rng.randint(1993, 2023)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}'
+                f.write(f'{registry}|{cc}|asn|{asns[i]}|{block}|{day}|{status}|{registry}-{rng.randrange(10 ** 8):x}\n')
+                for asn in asns[i:i + block]:
+                    countries[asn] = cc
+            i += block
+        # Address records: ignored by the ASN tables but parsed and stored
+        for j in range(len(asns)):
+            registry = rng.choices(list(REGISTRIES), REGISTRY_WEIGHTS)[0]
+            cc = rng.choice(REGISTRIES[registry])
+            f.write(f'{registry}|{cc}|ipv4|{j >> 16 & 255}.{j >> 8 & 255}.{j & 255}.0|256|20100101|allocated|{registry}-{j:x}\n')
+            if j % 2 == 0:
+                f.write(f'{registry}|{cc}|ipv6|2001:{j:x}::|32|20100101|allocated|{registry}-{j:x}|e-stats\n')
+    return countries
+
+
+def org_sizes(rng, count):
+    # Pareto-distributed organization sizes: mostly single-AS orgs, a few large ones
+    remaining = count
+    while remaining > 0:
+        size = min(remaining, ORG_MAX_SIZE, int(rng.paretovariate(1.6)))
+        remaining -= size
+        yield size
+
+
+def write_as_org(path, rng, asns, coverage=0.95):
+    covered = [asn for asn in asns if rng.random() < coverage]
+    rng.shuffle(covered)
+    with open(path, 'w') as f:
+        f.write('{')
+        first = True
+        position = 0
+        for org_id, size in enumerate(org_sizes(rng, len(covered))):
+            members = [str(asn) for asn in sorted(covered[position:position + size])]
+            position += size
+            name = f'Synthetic Org {org_id}'
+            for asn in members:
+                record = {
+                    'Status': 'ok',
+                    'Reference Orgs': [f'@org-{org_id}'],
+                    'Sibling ASNs': [sibling for sibling in members if sibling != asn],
+                    'Name': name,
+                    'Descr': f'{name} network',
+                    'Website': f'https://org{org_id}.example' if rng.random() < 0.7 else '',
+                    'Comparison with CA2O': rng.choice(['Same', 'Different']),
+                    'Comparison with PDB': rng.choice(['Same', 'Different', 'Not in PDB']),
+                    'PDB.org_id': str(org_id),
+                    'PDB.org': name,
+                }
+                f.write(('' if first else ', ') + json.dumps(asn) + ': ' + json.dumps(record))
+                first = False
+        f.write('}')
+    return len(covered)
+
+
+def write_categorized(path, rng, asns, coverage=0.9):
+    count = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['ASN', 'Category 1 - Layer 1', 'Category 1 - Layer 2', 'Category 2 - Layer 1', 'Category 2 - Layer 2'])
+        for asn in asns:
+            if rng.random() >= coverage:
+                continue
+            layer_1 = rng.choices(list(CATEGORIES), CATEGORY_WEIGHTS)[0]
+            writer.writerow([f'AS{asn}', layer_1, rng.choice(CATEGORIES[layer_1]), '', ''])
+            count += 1
+    return count
+
+
+def generate(output_dir, asn_count=100000, edge_count=500000, seed=1, compress=False):
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    asns = sample_asns(rng, asn_count)
+
+    summary = {'seed': seed, 'asns': asn_count}
+    summary['edges'] = write_as_rel(
+        os.path.join(output_dir, FILE_NAMES['as_rel']), generate_edges(rng, asns, edge_count), compress
+    )
+    countries = write_delegated_stats(os.path.join(output_dir, FILE_NAMES['delegated']), rng, asns)
+    summary['delegated_asns'] = len(countries)
+    summary['as_org_asns'] = write_as_org(os.path.join(output_dir, FILE_NAMES['as_org']), rng, asns)
+    summary['categorized_asns'] = write_categorized(os.path.join(output_dir, FILE_NAMES['categorized']), rng, asns)
+    return summary
+
+
+def degree_summary(path):
+    # Check the tail of the degree distribution: a few hubs, most ASes with 1-2 links
+    degrees = {}
+    with open(path) as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            a, b, _ = line.split('|')
+            degrees[a] = degrees.get(a, 0) + 1
+            degrees[b] = degrees.get(b, 0) + 1
+    values = sorted(degrees.values())
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {'median': pick(0.5), 'p99': pick(0.99), 'max': values[-1], 'degree_1_share': bisect.bisect_right(values, 1) / len(values)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic MANRS dataset in the formats of the monthly files.')
+    parser.add_argument('output_dir', help='directory to write the four files to')
+    parser.add_argument('--asns', type=int, default=100000)
+    parser.add_argument('--edges', type=int, default=500000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--bz2', action='store_true', help='write the as-rel file compressed, as published by CAIDA')
+    args = parser.parse_args()
+
+    summary = generate(args.output_dir, args.asns, args.edges, args.seed, args.bz2)
+    if not args.bz2:
+        summary['degrees'] = degree_summary(os.path.join(args.output_dir, FILE_NAMES['as_rel']))
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,151 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend.api.bulk import bulk_upsert, diff_upsert
+from backend.api.database import (
+    Base, CategorizedAsnTable, DatasetSnapshotTable, RelatedAsnTable, SnapshotChangeTable,
+    changed_asns_since, record_snapshot,
+)
+from backend.api.main import write_table
+
+
+def new_session():
+    # Base en mémoire: une seule connexion, partagée par la session et les curseurs bruts
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+@pytest.fixture
+def db():
+    session = new_session()
+    yield session
+    session.close()
+
+
+def categorized(asn, category="ISP"):
+    return {"asn": str(asn), "category_1": category, "category_2": ""}
+
+
+def table_rows(db, table):
+    columns = ", ".join(f'"{c.name}"' for c in table.columns if not c.primary_key)
+    return sorted(db.execute(text(f'SELECT {columns} FROM "{table.name}"')).fetchall())
+
+
+def test_bulk_upsert_inserts_then_updates_in_place(db):
+    table = CategorizedAsnTable.__table__
+    stats = bulk_upsert(db, table, (categorized(asn) for asn in range(10)), ["asn"], chunk_size=3)
+    assert stats["rows"] == 10
+
+    bulk_upsert(db, table, [categorized(3, "Hosting"), categorized(10)], ["asn"])
+    rows = table_rows(db, table)
+    assert len(rows) == 11
+    assert ("3", "Hosting", "") in rows
+
+
+def test_bulk_upsert_last_duplicate_wins(db):
+    table = CategorizedAsnTable.__table__
+    # Doublons dans un même lot et entre lots
+    rows = [categorized(1, "a"), categorized(1, "b"), categorized(2), categorized(1, "c")]
+    bulk_upsert(db, table, rows, ["asn"], chunk_size=2)
+    assert table_rows(db, table) == [("1", "c", ""), ("2", "ISP", "")]
+
+
+def test_bulk_upsert_creates_missing_conflict_index():
+    # Table du notebook (pandas to_sql): ni clé primaire ni index unique
+    db = new_session()
+    db.execute(text("DROP TABLE categorized_asn"))
+    db.execute(text('CREATE TABLE categorized_asn ("index" INTEGER, id INTEGER, asn TEXT, category_1 TEXT, category_2 TEXT)'))
+    db.commit()
+    table = CategorizedAsnTable.__table__
+    bulk_upsert(db, table, [categorized(1), categorized(1, "Hosting")], ["asn"])
+    assert table_rows(db, table) == [("1", "Hosting", "")]
+    db.close()
+
+
+def test_bulk_upsert_is_one_transaction(db):
+    table = SnapshotChangeTable.__table__
+    rows = [{"snapshot": 1, "table_name": "t", "asn": str(asn), "action": "insert"} for asn in range(5)]
+    rows.append({"snapshot": None, "table_name": "t", "asn": "5", "action": "insert"})
+    # L'échec du dernier lot (erreur sqlite3 du curseur brut) annule aussi les lots déjà écrits
+    with pytest.raises(sqlite3.IntegrityError):
+        bulk_upsert(db, table, rows, ["snapshot", "asn", "table_name", "action"], chunk_size=2)
+    assert table_rows(db, table) == []
+
+
+def test_diff_upsert_counts_and_content(db):
+    table = CategorizedAsnTable.__table__
+    bulk_upsert(db, table, [categorized(asn) for asn in range(5)], ["asn"])
+    rows = [categorized(0), categorized(1, "Hosting"), categorized(2), categorized(3), categorized(5)]
+    stats, changes = diff_upsert(db, table, rows, ["asn"])
+    assert (stats["rows"], stats["inserted"], stats["updated"], stats["deleted"]) == (5, 1, 1, 1)
+    assert sorted((action, (old or new)["asn"]) for action, old, new in changes) == [
+        ("delete", "4"), ("insert", "5"), ("update", "1"),
+    ]
+    assert table_rows(db, table) == sorted(tuple(row.values()) for row in rows)
+
+    # Même snapshot une seconde fois: rien à écrire
+    stats, changes = diff_upsert(db, table, rows, ["asn"])
+    assert (stats["inserted"], stats["updated"], stats["deleted"], changes) == (0, 0, 0, [])
+    assert table_rows(db, table) == sorted(tuple(row.values()) for row in rows)
+
+
+def test_diff_upsert_scope_leaves_other_rows(db):
+    table = RelatedAsnTable.__table__
+    key = ["asn", "kind", "related_asn"]
+    bulk_upsert(db, table, [
+        {"asn": "1", "kind": "sibling", "related_asn": "2"},
+        {"asn": "1", "kind": "provider", "related_asn": "3"},
+    ], key)
+    stats, _ = diff_upsert(db, table, [], key, RelatedAsnTable.kind.in_(["sibling"]))
+    assert stats["deleted"] == 1
+    assert table_rows(db, table) == [("1", "provider", "3")]
+
+
+def test_incremental_ingest_records_changes(db):
+    table = CategorizedAsnTable.__table__
+    write_table(db, table, [categorized(asn) for asn in range(3)], ["asn"])
+    first = record_snapshot(db, "categorized_asn")
+
+    changelog = []
+    write_table(db, table, [categorized(0), categorized(1, "Hosting"), categorized(3)], ["asn"], changelog)
+    second = record_snapshot(db, "categorized_asn", changelog)
+
+    recorded = db.query(SnapshotChangeTable.snapshot, SnapshotChangeTable.table_name, SnapshotChangeTable.asn, SnapshotChangeTable.action)
+    assert sorted(recorded) == [
+        (second, "categorized_asn", "1", "update"),
+        (second, "categorized_asn", "2", "delete"),
+        (second, "categorized_asn", "3", "insert"),
+    ]
+    assert db.query(DatasetSnapshotTable.changes).filter_by(id=second).scalar() == 3
+    assert changed_asns_since(db, first, second) == {"1", "2", "3"}
+    # Un rechargement complet entre deux versions n'a pas de journal
+    assert changed_asns_since(db, 0, second) is None
+
+    # Ré-exécution à l'identique: snapshot sans changement
+    changelog = []
+    write_table(db, table, [categorized(0), categorized(1, "Hosting"), categorized(3)], ["asn"], changelog)
+    third = record_snapshot(db, "categorized_asn", changelog)
+    assert changelog == []
+    assert changed_asns_since(db, second, third) == set()
+
+
+def test_incremental_matches_fresh_load(db):
+    table = CategorizedAsnTable.__table__
+    snapshots = [
+        [categorized(asn, "ISP") for asn in range(0, 300)],
+        [categorized(asn, "ISP" if asn % 7 else "Hosting") for asn in range(50, 400)],
+        [categorized(asn, "Education") for asn in range(0, 400, 3)] + [categorized(1000)],
+    ]
+    write_table(db, table, snapshots[0], ["asn"])
+    for rows in snapshots[1:]:
+        write_table(db, table, rows, ["asn"], [])
+
+    fresh = new_session()
+    write_table(fresh, table, snapshots[-1], ["asn"])
+    assert table_rows(db, table) == table_rows(fresh, table)
+    fresh.close()
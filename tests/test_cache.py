@@ -0,0 +1,55 @@
+from backend.api.cache import LRUCache
+from backend.api.metrics import cache_metrics
+
+
+def test_dependents_follow_evictions():
+    cache = LRUCache("test", 10)
+    for snapshot in range(1, 4):
+        for key in range(1000):
+            cache.put(key, "document", snapshot, depends_on=[key + 1, key + 2])
+        cache.invalidate(range(0, 1000, 7), snapshot + 1)
+    # Seuls les liens des entrées encore présentes restent
+    assert len(cache) <= 10
+    assert set(cache._dependencies) <= set(cache._entries)
+    assert all(keys <= set(cache._entries) for keys in cache._dependents.values())
+
+
+def test_invalidate_evicts_dependents():
+    cache = LRUCache("test", 10)
+    cache.put("a", 1, 1, depends_on=["b"])
+    cache.put("c", 2, 1, depends_on=["b"])
+    cache.put("d", 3, 1)
+    assert cache.invalidate(["b"], 2) == 2
+    assert cache.get("d", 2) == 3
+    assert cache._dependents == {} and cache._dependencies == {}
+
+
+def test_maxbytes_bounds_total_size():
+    cache = LRUCache("test", 100, maxbytes=10)
+    cache.put("a", b"1234", 1)
+    cache.put("b", b"1234", 1)
+    cache.put("a", b"12", 1)
+    assert cache.bytes == 6
+    # Les plus anciennes sortent jusqu'à repasser sous la borne
+    cache.put("c", b"123456", 1)
+    assert cache.get("b", 1) is None and cache.bytes == 8
+    # Trop grosse pour le cache: ignorée, le reste est gardé
+    cache.put("d", b"x" * 11, 1)
+    assert cache.get("d", 1) is None and len(cache) == 2
+    cache.invalidate(["a"], 2)
+    assert cache.bytes == 6
+    cache.clear()
+    assert cache.bytes == 0
+
+
+def test_counters_survive_cache_replacement():
+    # Un graphe rechargé recrée son cache des cônes: les compteurs continuent
+    cache = LRUCache("test_replaced", 10)
+    cache.put("a", 1, 1)
+    cache.get("a", 1)
+    cache.get("b", 1)
+    replacement = LRUCache("test_replaced", 10)
+    replacement.get("a", 1)
+    assert (replacement.stats()["hits"], replacement.stats()["misses"]) == (1, 2)
+    hits = cache_metrics([replacement])[0]
+    assert list(hits.samples()) == [("manrs_cache_hits_total", ("cache",), ("test_replaced",), 1)]
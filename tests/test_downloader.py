@@ -0,0 +1,129 @@
+import gzip
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from script import dowload_update_database as downloader
+
+BODY = b"".join(b"%d|ZZ|asn|%d|1|20230801|assigned\n" % (line, line) for line in range(2000))
+ETAG = '"v1"'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Serveur de fichiers local: Range, ETag et compression réglés par server.mode
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body, status, content_range = BODY, 200, None
+        range_header = self.headers.get("Range")
+        if range_header:
+            start = int(range_header.split("=")[1].rstrip("-"))
+            body, status = BODY[start:], 206
+            total = len(BODY) + 1 if server.mode == "bad_total" else len(BODY)
+            content_range = f"bytes {start}-{len(BODY) - 1}/{total}"
+        # Comme GitHub raw: gzip si le client l'accepte; "gzip" l'impose toujours
+        accept = self.headers.get("Accept-Encoding", "")
+        encoded = server.mode == "gzip" or (server.mode == "gzip_if_accepted" and "gzip" in accept)
+        if encoded:
+            body = gzip.compress(body)
+
+        self.send_response(status)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        if content_range:
+            self.send_header("Content-Range", content_range)
+        if encoded:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    httpd.daemon_threads = True
+    httpd.requests = []
+    httpd.mode = None
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def fetch(server, file_path, sha256=None):
+    with requests.Session() as session:
+        return downloader.fetch(session, f"{server.url}/nro-delegated-stats", str(file_path), sha256)
+
+
+def test_download_then_not_modified(server, tmp_path):
+    file_path = tmp_path / "nro-delegated-stats"
+    sha256 = hashlib.sha256(BODY).hexdigest()
+    assert fetch(server, file_path, sha256) == "downloaded"
+    assert file_path.read_bytes() == BODY
+    meta = json.loads((tmp_path / "nro-delegated-stats.meta.json").read_text())
+    assert (meta["etag"], meta["size"], meta["sha256"]) == (ETAG, len(BODY), sha256)
+
+    # Second passage: GET conditionnel, le fichier n'est pas réécrit
+    assert fetch(server, file_path, sha256) == "unchanged"
+    assert server.requests[-1]["If-None-Match"] == ETAG
+
+
+def test_resume_from_partial_file(server, tmp_path):
+    file_path = tmp_path / "nro-delegated-stats"
+    (tmp_path / "nro-delegated-stats.part").write_bytes(BODY[:1000])
+    (tmp_path / "nro-delegated-stats.part.meta.json").write_text(json.dumps({"etag": ETAG}))
+    assert fetch(server, file_path, hashlib.sha256(BODY).hexdigest()) == "downloaded"
+    assert server.requests[0]["Range"] == "bytes=1000-"
+    assert server.requests[0]["If-Range"] == ETAG
+    assert file_path.read_bytes() == BODY
+    assert not (tmp_path / "nro-delegated-stats.part.meta.json").exists()
+
+
+def test_size_mismatch_is_rejected(server, tmp_path):
+    server.mode = "bad_total"
+    (tmp_path / "nro-delegated-stats.part").write_bytes(BODY[:1000])
+    with pytest.raises(downloader.DownloadError, match="expected"):
+        fetch(server, tmp_path / "nro-delegated-stats")
+    assert not (tmp_path / "nro-delegated-stats").exists()
+
+
+def test_sha256_mismatch_is_rejected(server, tmp_path):
+    with pytest.raises(downloader.DownloadError, match="sha256"):
+        fetch(server, tmp_path / "nro-delegated-stats", "0" * 64)
+    assert not (tmp_path / "nro-delegated-stats").exists()
+    assert not (tmp_path / "nro-delegated-stats.part").exists()
+
+
+def test_compressed_transfer_is_not_requested(server, tmp_path):
+    server.mode = "gzip_if_accepted"
+    file_path = tmp_path / "nro-delegated-stats"
+    assert fetch(server, file_path, hashlib.sha256(BODY).hexdigest()) == "downloaded"
+    assert server.requests[0]["Accept-Encoding"] == "identity"
+    assert file_path.read_bytes() == BODY
+
+
+def test_compressed_transfer_forced_by_server(server, tmp_path):
+    # Content-Length compte les octets compressés: la taille n'est pas vérifiée,
+    # le sha256 du fichier décodé l'est toujours
+    server.mode = "gzip"
+    file_path = tmp_path / "nro-delegated-stats"
+    (tmp_path / "nro-delegated-stats.part").write_bytes(BODY[:1000])
+    with pytest.raises(downloader.DownloadError, match="restarting"):
+        fetch(server, file_path)
+    assert not (tmp_path / "nro-delegated-stats.part").exists()
+    assert fetch(server, file_path, hashlib.sha256(BODY).hexdigest()) == "downloaded"
+    assert file_path.read_bytes() == BODY
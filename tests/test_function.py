@@ -0,0 +1,40 @@
+import io
+import json
+
+import pytest
+
+from backend.api.function import JSON_READ_CHUNK_SIZE, iter_json
+
+DOCUMENTS = [
+    '{"k": "aa", "f": 12.75}',
+    '[2.5]',
+    '[1e10, -3.25E-2, 7]',
+    '{"a": 1, "b": [1.5, 2], "c": -0.5e+3, "d": true, "e": null}',
+    '[0, -0, 10, 1.0e-7, "x"]',
+]
+
+
+def decode(text, chunk_size):
+    items = list(iter_json(io.StringIO(text), chunk_size))
+    return items if text.lstrip().startswith("[") else dict(items)
+
+
+@pytest.mark.parametrize("text", DOCUMENTS)
+def test_every_chunk_boundary(text):
+    # Chaque découpage possible, y compris au milieu d'un nombre (12.|75, 1|e10)
+    for chunk_size in range(1, len(text) + 1):
+        assert decode(text, chunk_size) == json.loads(text), chunk_size
+
+
+def test_number_split_at_default_chunk_size():
+    # "12." termine le premier bloc de 64 Kio, "75" ouvre le suivant
+    prefix = '{"k": "", "f": 12.'
+    pad = "x" * (JSON_READ_CHUNK_SIZE - len(prefix))
+    text = '{"k": "' + pad + '", "f": 12.75}'
+    assert text.index(".") == JSON_READ_CHUNK_SIZE - 1
+    assert decode(text, JSON_READ_CHUNK_SIZE) == {"k": pad, "f": 12.75}
+
+
+def test_invalid_document_still_fails():
+    with pytest.raises(ValueError):
+        decode('{"f": 12.}', 4)
@@ -0,0 +1,120 @@
+import pytest
+
+from backend.api.graph import (
+    AsGraph, iter_as_rel_edges, CUSTOMERS, EDGE_KINDS, GRAPH_FORMAT_VERSION, GRAPH_HEADER, GRAPH_MAGIC, PEERS, PROVIDERS,
+)
+from backend.api.main import load_graph_snapshot
+
+# 1 et 5 fournisseurs de 2 et 4, chaîne 1 -> 2 -> 3 -> 4, 2 et 6 pairs
+AS_REL_LINES = [
+    "# source: synthetic",
+    "1|2|-1",
+    "2|3|-1",
+    "3|4|-1|bgp",
+    "1|5|-1",
+    "5|4|-1",
+    "2|6|0",
+    "7|7|-1",
+    "x|8|-1",
+    "8|9",
+    "",
+]
+
+
+@pytest.fixture
+def graph():
+    return AsGraph.from_edges(iter_as_rel_edges(AS_REL_LINES), "v1")
+
+
+def test_iter_as_rel_edges_skips_comments_and_bad_lines():
+    edges = list(iter_as_rel_edges(AS_REL_LINES))
+    assert edges[0] == (1, 2, -1)
+    assert (6, 2, 0) not in edges and (2, 6, 0) in edges
+    assert len(edges) == 7
+
+
+def test_from_edges_builds_neighbors(graph):
+    # La boucle 7|7 est ignorée
+    assert list(graph.asns) == [1, 2, 3, 4, 5, 6]
+    assert graph.edge_count == 6
+    assert graph.providers(4) == [3, 5]
+    assert graph.customers("AS1") == [2, 5]
+    assert graph.peers(2) == [6] and graph.peers(6) == [2]
+    assert graph.providers(1) == []
+    assert 7 not in graph and graph.neighbors(7, PROVIDERS) == []
+
+
+def test_cone_breadth_first_with_depth_and_via(graph):
+    cone = graph.cone(4, PROVIDERS)
+    assert cone["truncated"] is None
+    assert cone["results"] == [
+        {"asn": 3, "depth": 1, "via": 4},
+        {"asn": 5, "depth": 1, "via": 4},
+        {"asn": 2, "depth": 2, "via": 3},
+        {"asn": 1, "depth": 2, "via": 5},
+    ]
+    customers = graph.cone(1, CUSTOMERS)
+    assert [node["asn"] for node in customers["results"]] == [2, 5, 3, 4]
+    assert graph.cone(6, PEERS)["results"] == [{"asn": 2, "depth": 1, "via": 6}]
+    assert graph.cone(7) is None
+
+
+def test_cone_budgets(graph):
+    cone = graph.cone(4, PROVIDERS, max_depth=1)
+    assert (cone["depth"], cone["total_results"], cone["truncated"]) == (1, 2, None)
+
+    cone = graph.cone(4, PROVIDERS, max_nodes=3)
+    assert (cone["total_results"], cone["truncated"]) == (3, "max_nodes")
+
+    # Budget déjà épuisé: le premier noeud est développé, puis le parcours s'arrête
+    cone = graph.cone(4, PROVIDERS, max_nodes=100, time_budget=-1)
+    assert ([node["asn"] for node in cone["results"]], cone["truncated"]) == ([3, 5], "time_budget")
+
+
+def test_cone_cache_skips_time_truncated_results(graph):
+    assert graph.cone(4, PROVIDERS) is graph.cone(4, PROVIDERS)
+    first = graph.cone(1, CUSTOMERS, max_nodes=50, time_budget=-1)
+    assert graph.cone(1, CUSTOMERS, max_nodes=50, time_budget=-1) is not first
+
+
+def test_save_load_round_trip(graph, tmp_path):
+    path = str(tmp_path / "graph.bin")
+    graph.save(path)
+    loaded = AsGraph.load(path)
+    assert loaded.version == "v1"
+    assert list(loaded.asns) == list(graph.asns)
+    for kind in EDGE_KINDS:
+        assert list(loaded.offsets[kind]) == list(graph.offsets[kind])
+        assert list(loaded.targets[kind]) == list(graph.targets[kind])
+    assert loaded.cone(4, PROVIDERS)["results"] == graph.cone(4, PROVIDERS)["results"]
+    # Aucun fichier temporaire laissé à côté du snapshot
+    assert [entry.name for entry in tmp_path.iterdir()] == ["graph.bin"]
+
+
+def test_load_rejects_other_formats(graph, tmp_path):
+    path = tmp_path / "graph.bin"
+    graph.save(str(path))
+    data = path.read_bytes()
+
+    # Format binaire d'une autre version
+    path.write_bytes(GRAPH_HEADER.pack(GRAPH_MAGIC, GRAPH_FORMAT_VERSION + 1, 0) + data[GRAPH_HEADER.size:])
+    with pytest.raises(ValueError, match="not a graph snapshot"):
+        AsGraph.load(str(path))
+    path.write_bytes(b"NOTAGRPH" + data[8:])
+    with pytest.raises(ValueError, match="not a graph snapshot"):
+        AsGraph.load(str(path))
+    path.write_bytes(data[:GRAPH_HEADER.size - 1])
+    with pytest.raises(ValueError, match="truncated"):
+        AsGraph.load(str(path))
+
+
+def test_load_graph_snapshot_falls_back_when_stale(graph, tmp_path):
+    path = str(tmp_path / "graph.bin")
+    assert load_graph_snapshot(path, "v1") is None
+    graph.save(path)
+    assert load_graph_snapshot(path, "v1").version == "v1"
+    # Snapshot d'une autre version des relations: reconstruit depuis la base
+    assert load_graph_snapshot(path, "v2") is None
+    with open(path, "r+b") as file:
+        file.write(b"CORRUPT!")
+    assert load_graph_snapshot(path, "v1") is None
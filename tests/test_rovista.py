@@ -0,0 +1,138 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend.api.rovista import RovistaFetcher
+
+ETAG = '"v1"'
+LAST_MODIFIED = "Tue, 01 Aug 2023 00:00:00 GMT"
+
+
+def csv_body(asn):
+    return f"date,ratio\n2023-07-01,0.5\n2023-08-01,0.{asn}\n"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Serveur RoVista local: /asn/<asn>.csv, comportement réglé par server.status
+    def do_GET(self):
+        server = self.server
+        asn = self.path.rsplit("/", 1)[-1].split(".")[0]
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.delay)
+            if server.status != 200:
+                self.send_response(server.status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            elif self.headers.get("If-None-Match") == ETAG:
+                self.send_response(304)
+                self.end_headers()
+            else:
+                body = csv_body(asn).encode()
+                self.send_response(200)
+                self.send_header("ETag", ETAG)
+                self.send_header("Last-Modified", LAST_MODIFIED)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.requests = []
+    httpd.in_flight = 0
+    httpd.max_in_flight = 0
+    httpd.delay = 0.0
+    httpd.status = 200
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def run(fetcher, coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await fetcher.aclose()
+    return asyncio.run(main())
+
+
+def test_fetch_writes_cache(server, tmp_path):
+    fetcher = RovistaFetcher(base_url=server.url, cache_dir=str(tmp_path))
+    assert run(fetcher, fetcher.fetch_csv("13335")) == csv_body("13335")
+    assert server.requests[0][0] == "/asn/13335.csv"
+    assert (tmp_path / "13335.csv").read_text() == csv_body("13335")
+    meta = json.loads((tmp_path / "13335.meta.json").read_text())
+    assert meta == {"etag": ETAG, "last_modified": LAST_MODIFIED}
+
+
+def test_not_modified_revalidates_from_cache(server, tmp_path):
+    fetcher = RovistaFetcher(base_url=server.url, cache_dir=str(tmp_path))
+    run(fetcher, fetcher.fetch_csv("1"))
+    # Second appel: GET conditionnel, le serveur répond 304 et le cache est servi
+    fetcher = RovistaFetcher(base_url=server.url, cache_dir=str(tmp_path))
+    assert run(fetcher, fetcher.fetch_csv("1")) == csv_body("1")
+    headers = server.requests[1][1]
+    assert headers["If-None-Match"] == ETAG
+    assert headers["If-Modified-Since"] == LAST_MODIFIED
+
+
+def test_server_error_falls_back_to_cache(server, tmp_path):
+    fetcher = RovistaFetcher(base_url=server.url, cache_dir=str(tmp_path))
+    run(fetcher, fetcher.fetch_csv("2"))
+    server.status = 503
+    fetcher = RovistaFetcher(base_url=server.url, cache_dir=str(tmp_path))
+    assert run(fetcher, fetcher.fetch_csv("2")) == csv_body("2")
+    # Sans copie en cache, rien à servir
+    fetcher = RovistaFetcher(base_url=server.url, cache_dir=str(tmp_path))
+    assert run(fetcher, fetcher.fetch_csv("3")) is None
+
+
+def test_not_found_is_not_served_from_cache(server, tmp_path):
+    fetcher = RovistaFetcher(base_url=server.url, cache_dir=str(tmp_path))
+    run(fetcher, fetcher.fetch_csv("4"))
+    server.status = 404
+    fetcher = RovistaFetcher(base_url=server.url, cache_dir=str(tmp_path))
+    assert run(fetcher, fetcher.fetch_csv("4")) is None
+
+
+def test_concurrency_is_bounded(server):
+    server.delay = 0.05
+    fetcher = RovistaFetcher(base_url=server.url, cache_dir=None, concurrency=3)
+    asns = [str(asn) for asn in range(1, 13)]
+    contents = run(fetcher, fetcher.fetch_csvs(asns))
+    assert contents == {asn: csv_body(asn) for asn in asns}
+    assert server.max_in_flight == 3
+
+
+def test_connection_error_returns_cache(server, tmp_path):
+    fetcher = RovistaFetcher(base_url=server.url, cache_dir=str(tmp_path))
+    run(fetcher, fetcher.fetch_csv("5"))
+
+    # Port fermé: l'erreur de connexion n'interrompt pas le lot
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        closed_url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    fetcher = RovistaFetcher(base_url=closed_url, cache_dir=str(tmp_path))
+    assert run(fetcher, fetcher.fetch_csvs(["5", "6"])) == {"5": csv_body("5"), "6": None}